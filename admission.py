@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import OrderedDict
+from metrics import coalesced_calls
+
+
+class ConcurrencyLimit:
+    # At most limit holders at once, others wait up to timeout seconds
+    # for a free slot and are refused after that
+    def __init__(self, limit, timeout):
+        self.limit = limit
+        self.timeout = timeout
+        self.semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self):
+        return self.semaphore.acquire(timeout=self.timeout)
+
+    def release(self):
+        self.semaphore.release()
+
+
+class Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    # Calls made with the same key while one is running don't run
+    # again, they wait for the running one and get its result or error
+    def __init__(self, kind):
+        # Label of coalesced calls in metrics
+        self.kind = kind
+        # key -> Call in flight
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            running = call is not None
+            if not running:
+                call = self.calls[key] = Call()
+        if running:
+            coalesced_calls.inc(self.kind)
+            return call.wait()
+        try:
+            call.result = function(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+class SharedResults:
+    # Results of the latest size keys, each computed once even when
+    # asked for by many callers at the same time
+    def __init__(self, kind, size):
+        self.size = size
+        self.flight = SingleFlight(kind)
+        # key -> result, least recently used first
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, function, *args):
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        result = self.flight.do(key, function, *args)
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+        return result
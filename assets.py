@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os
+import mimetypes
+from compression import (supported_encodings, is_compressible, compress,
+                         make_etag)
+
+# Bigger files are not kept in memory but sent with os.sendfile,
+# only their compressed variants are.
+LARGE_FILE_SIZE = 256 * 1024
+
+CONTENT_TYPES = {
+    ".html": "text/html",
+    ".js": "text/javascript",
+    ".css": "text/css",
+    ".json": "application/json",
+    ".map": "application/json",
+    ".txt": "text/plain",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".ico": "image/x-icon",
+    ".svg": "image/svg+xml",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".eot": "application/vnd.ms-fontobject",
+}
+
+
+def guess_content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return (CONTENT_TYPES.get(extension)
+            or mimetypes.guess_type(path)[0]
+            or "application/octet-stream")
+
+
+class Asset:
+    __slots__ = ("content_type", "size", "etag", "data", "fd", "encoded")
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.content_type = guess_content_type(path)
+        self.size = len(data)
+        self.etag = make_etag(data)
+        # encoding -> compressed bytes
+        self.encoded = {}
+        if is_compressible(self.content_type, self.size):
+            for encoding in supported_encodings():
+                self.encoded[encoding] = compress(data, encoding, best=True)
+        if self.size > LARGE_FILE_SIZE and hasattr(os, "sendfile"):
+            self.data = None
+            self.fd = os.open(path, os.O_RDONLY)
+        else:
+            self.data = data
+            self.fd = None
+
+
+class AssetRegistry:
+    def __init__(self, directory):
+        # url path -> Asset, loaded once at startup
+        self.assets = {}
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                url = "/" + os.path.relpath(path, directory).replace(os.sep, "/")
+                self.assets[url] = Asset(path)
+
+    def get(self, url):
+        return self.assets.get(url)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from html import escape
+from metrics import cache_lookups
+
+
+def render_backlinks(backlinks):
+    parts = []
+    for backlink in backlinks:
+        parts.append(
+            '<div class="outline-3">'
+            '<h3><a name="backlink" id="%s" href="javascript:void(0)">%s</a></h3>'
+            '<div class="outline-text-3"><p>'
+            % (escape(os.path.basename(backlink.source)),
+               escape(backlink.title)))
+        for target, description in backlink.links:
+            parts.append(
+                '<a name="backlink" id="%s" href="javascript:void(0)">%s</a> '
+                % (escape(target), escape(description)))
+        parts.append("</p></div></div>")
+    return "".join(parts)
+
+
+class BacklinksCache:
+    def __init__(self, graph_store):
+        self.graph_store = graph_store
+        # dest path -> rendered backlinks of the note
+        self.fragments = {}
+        self.lock = threading.Lock()
+        with graph_store.lock:
+            # Graph may already be loaded, e.g. from a snapshot
+            self.version = graph_store.graph.version
+            graph_store.subscribe(self.invalidate)
+
+    def invalidate(self, old, new):
+        # Drop only notes whose backlinks differ between versions
+        with self.lock:
+            self.version = new.version
+            for path in list(self.fragments):
+                if old.backlinks.get(path) != new.backlinks.get(path):
+                    del self.fragments[path]
+
+    def get(self, path):
+        graph = self.graph_store.get()
+        with self.lock:
+            fragment = self.fragments.get(path)
+        if fragment is not None:
+            cache_lookups.inc("backlinks", "hit")
+        else:
+            cache_lookups.inc("backlinks", "miss")
+            fragment = render_backlinks(graph.backlinks.get(path, ()))
+            with self.lock:
+                # Graph may have been rebuilt while rendering
+                if graph.version == self.version:
+                    self.fragments[path] = fragment
+        return fragment
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import quote_string  # noqa: E402
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+# Average number of links from a note, most notes have few,
+# some have dozens
+LINKS_PER_NOTE = 5
+MAX_LINKS_PER_NOTE = 60
+# Share of links picked by popularity, the rest goes to random notes,
+# which gives the long tail of in-degrees seen in real vaults
+PREFERENTIAL_LINKS = 0.8
+DEAD_LINKS = 0.02
+JOURNAL_NOTES = 0.15
+ALIASED_NOTES = 0.1
+TOPIC_DIRECTORIES = 12
+
+TAGS = [
+    "project", "reading", "idea", "person", "meeting", "book", "paper",
+    "emacs", "python", "todo", "draft", "reference", "health", "travel",
+    "music", "history", "math", "physics", "design", "recipe", "work",
+    "linux", "writing", "quote", "course", "finance", "garden", "film",
+    "game", "language",
+]
+# Tags follow Zipf's law, few are everywhere
+TAG_WEIGHTS = [1.0 / rank for rank in range(1, len(TAGS) + 1)]
+TAG_COUNTS = [0, 0, 1, 1, 1, 2, 2, 3]
+
+WORDS = """lorem ipsum dolor sit amet consectetur adipiscing elit sed do
+eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad minim
+veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo
+consequat duis aute irure in reprehenderit voluptate velit esse cillum
+fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt
+culpa qui officia deserunt mollit anim id est laborum note graph idea
+question answer source memory habit system process theory example""".split()
+
+SCHEMA = """
+CREATE TABLE files (file UNIQUE PRIMARY KEY, hash NOT NULL, meta NOT NULL);
+CREATE TABLE ids (id UNIQUE PRIMARY KEY, file NOT NULL, level NOT NULL);
+CREATE TABLE links (source NOT NULL, dest NOT NULL, type NOT NULL,
+                    properties NOT NULL);
+CREATE TABLE tags (file UNIQUE PRIMARY KEY, tags);
+CREATE TABLE titles (file NOT NULL, title);
+CREATE TABLE refs (ref UNIQUE NOT NULL, file NOT NULL, type NOT NULL);
+"""
+
+CONFIG_FILES = {
+    "org-roam-server-light-network-vis-options": "",
+    "org-roam-server-light-default-include-filters": "null",
+    "org-roam-server-light-default-exclude-filters": "null",
+    "org-roam-server-light-style": "",
+}
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def elisp_time(timestamp):
+    seconds = int(timestamp)
+    return "(%d %d 0 0)" % (seconds >> 16, seconds & 0xFFFF)
+
+
+class Note:
+    __slots__ = ("path", "title", "aliases", "tags", "links")
+
+    def __init__(self, path, title):
+        self.path = path
+        self.title = title
+        self.aliases = []
+        self.tags = []
+        # (target path, description)
+        self.links = []
+
+
+def make_notes(rng, notes_dir, count):
+    notes = []
+    start = time.mktime((2019, 1, 1, 0, 0, 0, 0, 0, -1))
+    for index in range(count):
+        stamp = time.strftime("%Y%m%d%H%M%S",
+                              time.localtime(start + index * 3607))
+        if rng.random() < JOURNAL_NOTES:
+            directory = os.path.join(notes_dir, "daily")
+            title = time.strftime("%A, %d %B %Y",
+                                  time.localtime(start + index * 3607))
+            note = Note(os.path.join(directory, stamp + ".org"), title)
+            note.tags.append("journal")
+        else:
+            directory = notes_dir
+            if rng.random() < 0.5:
+                directory = os.path.join(
+                    notes_dir, "topic-%d" % rng.randrange(TOPIC_DIRECTORIES))
+            title = sentence(rng, rng.randint(1, 5)).capitalize()
+            note = Note(os.path.join(
+                directory, "%s-%s.org" % (stamp, title.lower().replace(" ", "_"))),
+                title)
+            note.tags.extend(rng.choices(TAGS, TAG_WEIGHTS,
+                                         k=rng.choice(TAG_COUNTS)))
+            note.tags = sorted(set(note.tags))
+            if rng.random() < ALIASED_NOTES:
+                note.aliases.append(sentence(rng, 2).capitalize())
+        notes.append(note)
+
+    # Every note starts with one ticket in the pool and gains one
+    # for each link pointing to it
+    pool = list(range(count))
+    for index, note in enumerate(notes):
+        wanted = min(int(rng.expovariate(1.0 / LINKS_PER_NOTE)),
+                     MAX_LINKS_PER_NOTE)
+        targets = set()
+        for _ in range(wanted):
+            if rng.random() < DEAD_LINKS:
+                note.links.append((os.path.join(
+                    notes_dir, "missing-%d.org" % rng.randrange(count)),
+                    "missing"))
+                continue
+            if rng.random() < PREFERENTIAL_LINKS:
+                target = rng.choice(pool)
+            else:
+                target = rng.randrange(count)
+            if target == index or target in targets:
+                continue
+            targets.add(target)
+            pool.append(target)
+            note.links.append((notes[target].path, notes[target].title))
+    return notes
+
+
+def write_note(rng, note):
+    lines = ["#+title: " + note.title]
+    if note.aliases:
+        lines.append("#+roam_alias: " + " ".join(
+            '"%s"' % alias for alias in note.aliases))
+    if note.tags:
+        lines.append("#+roam_tags: " + " ".join(note.tags))
+    lines.append("")
+    contexts = []
+    links = list(note.links)
+    for heading in range(rng.randint(1, 4)):
+        lines.append("* " + sentence(rng, rng.randint(1, 4)).capitalize())
+        for _ in range(rng.randint(1, 3)):
+            paragraph = sentence(rng, rng.randint(8, 40)).capitalize() + "."
+            if links:
+                target, description = links.pop()
+                link = "[[file:%s][%s]]" % (
+                    os.path.relpath(target, os.path.dirname(note.path)),
+                    description)
+                paragraph += " See " + link + "."
+                contexts.append((target, paragraph,
+                                 len("\n".join(lines)) + 1))
+            lines.append(paragraph)
+            lines.append("")
+    # Links which didn't fit into paragraphs end up in a list
+    for target, description in links:
+        item = "- [[file:%s][%s]]" % (
+            os.path.relpath(target, os.path.dirname(note.path)), description)
+        contexts.append((target, item, len("\n".join(lines)) + 1))
+        lines.append(item)
+
+    text = "\n".join(lines) + "\n"
+    os.makedirs(os.path.dirname(note.path), exist_ok=True)
+    with open(note.path, "w", encoding="utf8") as f:
+        f.write(text)
+    return text, contexts
+
+
+def generate(directory, count, seed=0):
+    # Writes org-roam.db, notes/ and server/ (contents of the
+    # org-roam-server-light tmp dir) into directory
+    rng = random.Random(seed)
+    directory = os.path.abspath(directory)
+    notes_dir = os.path.join(directory, "notes")
+    server_dir = os.path.join(directory, "server")
+    db_path = os.path.join(directory, "org-roam.db")
+    os.makedirs(server_dir, exist_ok=True)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    notes = make_notes(rng, notes_dir, count)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    now = time.time()
+    for note in notes:
+        text, contexts = write_note(rng, note)
+        file = quote_string(note.path)
+        conn.execute("INSERT INTO files VALUES (?, ?, ?)", (
+            file,
+            quote_string(hashlib.sha1(text.encode("utf8")).hexdigest()),
+            "(:atime %s :mtime %s)" % (elisp_time(now), elisp_time(now))))
+        conn.executemany("INSERT INTO titles VALUES (?, ?)", [
+            (file, quote_string(title))
+            for title in [note.title] + note.aliases])
+        if note.tags:
+            conn.execute("INSERT INTO tags VALUES (?, ?)", (
+                file, "(" + " ".join(quote_string(tag)
+                                     for tag in note.tags) + ")"))
+        conn.executemany("INSERT INTO links VALUES (?, ?, ?, ?)", [
+            (file, quote_string(target), quote_string("file"),
+             "(:content %s :point %d)" % (quote_string(content), point))
+            for target, content, point in contexts])
+    conn.commit()
+    conn.close()
+
+    config = dict(CONFIG_FILES)
+    config["org-roam-directory"] = notes_dir
+    config["org-roam-db-location"] = db_path
+    config["org-roam-server-light-last-roam-buffer"] = os.path.splitext(
+        os.path.basename(notes[0].path))[0] if notes else ""
+    config["bench-notes"] = "%d %d" % (count, seed)
+    for name, value in config.items():
+        with open(os.path.join(server_dir, name), "w", encoding="utf8") as f:
+            f.write(value)
+    return notes
+
+
+def parse_size(value):
+    return SIZES[value] if value in SIZES else int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic org-roam v1 database and notes")
+    parser.add_argument("directory")
+    parser.add_argument("-n", "--notes", type=parse_size, default="1k",
+                        help="number of notes or one of %s (default 1k)"
+                        % ", ".join(SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.time()
+    generate(args.directory, args.notes, args.seed)
+    print("Generated %d notes in %s in %.1fs" % (
+        args.notes, args.directory, time.time() - started))
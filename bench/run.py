@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from generate import SIZES, generate, parse_size
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 120
+# Relative slowdown of p50 or p99 reported as regression
+REGRESSION_THRESHOLD = 0.2
+
+
+def endpoints(notes, rng):
+    # name -> function returning next URL path to request
+    def note():
+        return rng.choice(notes)
+
+    def note_id():
+        return os.path.splitext(os.path.basename(note().path))[0]
+
+    def buffer():
+        target = note()
+        return "/org-roam-buffer?" + urllib.parse.urlencode({
+            "path": target.path, "label": target.title})
+
+    def word():
+        return rng.choice(note().title.split())
+
+    return {
+        "roam-data": lambda: "/roam-data?force=1",
+        "roam-data-columnar": lambda: "/roam-data?force=1&format=columnar",
+        "org-roam-buffer": buffer,
+        "preview": lambda: "/" + note_id() + ".html",
+        "subgraph": lambda: "/subgraph?depth=2&root=" + note_id(),
+        "graph-stats": lambda: "/graph-stats",
+        "search": lambda: "/search?q=" + urllib.parse.quote(word()),
+        "index": lambda: "/",
+    }
+
+
+def percentile(values, share):
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(share * len(values))) - 1))
+    return values[index]
+
+
+def peak_memory(pid):
+    # Peak resident size of the server in MiB since the last reset
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory(pid):
+    try:
+        with open("/proc/%d/clear_refs" % pid, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def fetch(base, path, headers):
+    request = urllib.request.Request(base + path, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size = len(e.read())
+        status = e.code
+    except OSError:
+        size = 0
+        status = None
+    return time.perf_counter() - started, status, size
+
+
+def measure(base, make_path, requests, concurrency, headers):
+    paths = [make_path() for _ in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda path: fetch(base, path, headers), paths))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(result[0] * 1000 for result in results)
+    return {
+        "requests": requests,
+        "errors": sum(1 for result in results if result[1] != 200),
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+        "throughput": requests / elapsed,
+        "bytes": sum(result[2] for result in results) / requests,
+    }
+
+
+def start_server(server_dir, port, server_args):
+    env = dict(os.environ, ORG_ROAM_SERVER_LIGHT_TMP_DIR=server_dir)
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--port", str(port)] + server_args,
+        cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = "http://localhost:%d" % port
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Server exited with code %d" % process.returncode)
+        try:
+            urllib.request.urlopen(base + "/server-css").read()
+            return process, base
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("Server didn't start in %d seconds" % STARTUP_TIMEOUT)
+
+
+def report(results, baseline):
+    columns = ("endpoint", "requests", "errors", "p50 ms", "p90 ms",
+               "p99 ms", "max ms", "req/s", "KiB/req", "peak MiB", "cold ms")
+    print("%-20s" % columns[0] + "".join("%10s" % c for c in columns[1:]))
+    regressions = []
+    for name, result in results.items():
+        peak = result["peak"]
+        print("%-20s%10d%10d%10.1f%10.1f%10.1f%10.1f%10.1f%10.1f%10s%10.1f" % (
+            name, result["requests"], result["errors"], result["p50"],
+            result["p90"], result["p99"], result["max"], result["throughput"],
+            result["bytes"] / 1024,
+            "-" if peak is None else "%.1f" % peak, result["cold"]))
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for key in ("p50", "p99"):
+            if result[key] > previous[key] * (1 + REGRESSION_THRESHOLD):
+                regressions.append("%s %s %.1f ms -> %.1f ms" % (
+                    name, key, previous[key], result[key]))
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark org-roam-server-light endpoints "
+        "against a synthetic vault",
+        epilog="Arguments after -- are passed to main.py")
+    parser.add_argument("-n", "--notes", type=parse_size, default="1k",
+                        help="number of notes or one of %s (default 1k)"
+                        % ", ".join(SIZES))
+    parser.add_argument("--dir", default=None,
+                        help="where the vault is generated, reused when it "
+                        "has the same size (default: bench-NOTES in tmp dir)")
+    parser.add_argument("-r", "--requests", type=int, default=200,
+                        help="requests per endpoint (default 200)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("-e", "--endpoint", action="append",
+                        help="only benchmark this endpoint, can be repeated")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--compressed", action="store_true",
+                        help="send Accept-Encoding: gzip, br")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline",
+                        help="results of an earlier --json run to compare with")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("server_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    directory = args.dir or os.path.join(
+        os.environ.get("TMPDIR", "/tmp"), "bench-%d" % args.notes)
+    server_dir = os.path.join(os.path.abspath(directory), "server")
+    marker = os.path.join(server_dir, "bench-notes")
+    rng = random.Random(args.seed)
+    # Generating is deterministic, so notes are generated again
+    # only to pick URLs when the vault already exists
+    try:
+        with open(marker) as f:
+            reuse = f.read() == "%d %d" % (args.notes, args.seed)
+    except OSError:
+        reuse = False
+    if reuse:
+        from generate import make_notes
+        notes = make_notes(random.Random(args.seed),
+                           os.path.join(os.path.abspath(directory), "notes"),
+                           args.notes)
+    else:
+        print("Generating %d notes in %s" % (args.notes, directory))
+        notes = generate(directory, args.notes, args.seed)
+
+    server_args = [arg for arg in args.server_args if arg != "--"]
+    server, base = start_server(server_dir, args.port, server_args)
+    headers = {"Accept-Encoding": "gzip, br"} if args.compressed else {}
+    selected = endpoints(notes, rng)
+    if args.endpoint:
+        selected = {name: selected[name] for name in args.endpoint}
+
+    results = {}
+    try:
+        for name, make_path in selected.items():
+            reset_peak_memory(server.pid)
+            cold = fetch(base, make_path(), headers)[0] * 1000
+            result = measure(base, make_path, args.requests,
+                             args.concurrency, headers)
+            result["cold"] = cold
+            result["peak"] = peak_memory(server.pid)
+            results[name] = result
+    finally:
+        server.terminate()
+        server.wait()
+
+    if all(result["peak"] is None for result in results.values()):
+        # Without /proc only the peak of the whole run is known
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        if sys.platform == "darwin":
+            peak /= 1024
+        for result in results.values():
+            result["peak"] = peak
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"notes": args.notes, "requests": args.requests,
+                       "concurrency": args.concurrency,
+                       "results": results}, f, indent=2)
+    sys.exit(1 if regressions else 0)
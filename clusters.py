@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+from worker import GraphJob
+
+# Louvain passes over all nodes of a level, moves stop mattering
+# long before this
+MAX_PASSES = 20
+# Smallest modularity gain counted as improvement
+MIN_GAIN = 1e-9
+CLUSTER_PREFIX = "cluster-"
+
+
+def louvain_level(adjacency, self_loops):
+    # Community of every node after moving nodes to the neighbouring
+    # community with the best modularity gain until nothing moves.
+    # adjacency is dict neighbour -> weight per node, without self loops.
+    count = len(adjacency)
+    degrees = [sum(adjacency[i].values()) + 2 * self_loops[i]
+               for i in range(count)]
+    total = float(sum(degrees))
+    community = list(range(count))
+    if total == 0:
+        return community
+    # community -> sum of degrees of its nodes
+    totals = list(degrees)
+    for _ in range(MAX_PASSES):
+        moved = False
+        for node in range(count):
+            current = community[node]
+            links = {}
+            for neighbour, weight in adjacency[node].items():
+                links[community[neighbour]] = (
+                    links.get(community[neighbour], 0) + weight)
+            degree = degrees[node]
+            totals[current] -= degree
+            best = current
+            best_gain = links.get(current, 0) - totals[current] * degree / total
+            for candidate, weight in links.items():
+                gain = weight - totals[candidate] * degree / total
+                if gain > best_gain + MIN_GAIN:
+                    best, best_gain = candidate, gain
+            totals[best] += degree
+            if best != current:
+                community[node] = best
+                moved = True
+        if not moved:
+            break
+    # Numbered from 0 in order of their first node
+    numbers = {}
+    return [numbers.setdefault(label, len(numbers)) for label in community]
+
+
+def aggregate(adjacency, self_loops, community, count):
+    # Graph of communities, weights of links inside one become its loop
+    new_adjacency = [{} for _ in range(count)]
+    new_self_loops = [0] * count
+    for node, neighbours in enumerate(adjacency):
+        source = community[node]
+        new_self_loops[source] += self_loops[node]
+        for neighbour, weight in neighbours.items():
+            dest = community[neighbour]
+            if dest == source:
+                # Every link inside is seen from both of its ends
+                new_self_loops[source] += weight / 2
+            else:
+                new_adjacency[source][dest] = (
+                    new_adjacency[source].get(dest, 0) + weight)
+    return new_adjacency, new_self_loops
+
+
+def compute_clusters(count, edges):
+    # Runs in a worker process, edges are (source index, dest index)
+    # pairs of count nodes. Returns parents per level, the first maps
+    # nodes to clusters of level 1, every next one clusters of the
+    # previous level to clusters containing them.
+    adjacency = [{} for _ in range(count)]
+    for source, dest in edges:
+        if source != dest:
+            adjacency[source][dest] = adjacency[source].get(dest, 0) + 1
+            adjacency[dest][source] = adjacency[dest].get(source, 0) + 1
+    self_loops = [0] * count
+    levels = []
+    while True:
+        community = louvain_level(adjacency, self_loops)
+        clusters = max(community) + 1 if community else 0
+        if clusters == len(adjacency):
+            break
+        levels.append(community)
+        adjacency, self_loops = aggregate(adjacency, self_loops, community,
+                                          clusters)
+    return levels
+
+
+class Hierarchy:
+    # Clusters of one graph, level 0 are the notes themselves
+    def __init__(self, graph, ids, levels):
+        self.graph = graph
+        self.ids = ids
+        self.index = {node_id: i for i, node_id in enumerate(ids)}
+        # level -> cluster -> elements of the level below
+        self.children = [None]
+        # level -> cluster -> indices of notes inside
+        self.members = [[[i] for i in range(len(ids))]]
+        for parents in levels:
+            below = self.members[-1]
+            children = [[] for _ in range(max(parents) + 1)]
+            members = [[] for _ in children]
+            for element, parent in enumerate(parents):
+                children[parent].append(element)
+                members[parent].extend(below[element])
+            self.children.append(children)
+            self.members.append(members)
+        # Notes linked the most represent their cluster
+        degrees = [graph.degree(node_id) for node_id in ids]
+        self.hubs = [[max(members, key=lambda i: (degrees[i], -i))
+                      for members in level] for level in self.members]
+
+    def levels(self):
+        return len(self.members) - 1
+
+    def size(self, level):
+        return len(self.members[level])
+
+    def cluster_id(self, level, cluster):
+        return "%s%d-%d" % (CLUSTER_PREFIX, level, cluster)
+
+    def parse_cluster_id(self, cluster_id):
+        # (level, cluster), None for ids of notes or unknown clusters
+        if not cluster_id.startswith(CLUSTER_PREFIX):
+            return None
+        try:
+            level, cluster = map(int, cluster_id[len(CLUSTER_PREFIX):]
+                                 .split("-"))
+        except ValueError:
+            return None
+        if 0 < level < len(self.members) and 0 <= cluster < self.size(level):
+            return level, cluster
+        return None
+
+    def detail_level(self, max_nodes):
+        # Most detailed level with at most max_nodes elements
+        for level in range(len(self.members)):
+            if self.size(level) <= max_nodes:
+                return level
+        return self.levels()
+
+    def view(self, level, expanded):
+        # (level, element) pairs shown at level, where clusters in
+        # expanded are replaced by what they contain, recursively,
+        # and clusters containing one element by that element
+        shown = []
+        pending = [(level, element) for element in range(self.size(level))]
+        while pending:
+            level, element = pending.pop()
+            if level > 0 and (
+                    (level, element) in expanded
+                    or len(self.children[level][element]) == 1):
+                pending.extend((level - 1, child)
+                               for child in self.children[level][element])
+            else:
+                shown.append((level, element))
+        shown.sort()
+        return shown
+
+    def to_dict(self, graph, level, expanded, version):
+        # Shown clusters and notes with links between them, weight
+        # of a link is the number of links between notes inside
+        shown = self.view(level, expanded)
+        owner = [None] * len(self.ids)
+        nodes = []
+        for index, (element_level, element) in enumerate(shown):
+            for member in self.members[element_level][element]:
+                owner[member] = index
+            if element_level == 0:
+                nodes.append(graph.node_dict(graph.nodes[self.ids[element]]))
+                continue
+            hub = graph.nodes[self.ids[self.hubs[element_level][element]]]
+            size = len(self.members[element_level][element])
+            nodes.append({
+                "id": self.cluster_id(element_level, element),
+                "label": "%s (%d)" % (hub.title, size),
+                "cluster": True,
+                "level": element_level,
+                "size": size,
+                "hub": hub.id,
+            })
+        weights = {}
+        for source, dest in graph.edges:
+            if source not in self.index or dest not in self.index:
+                continue
+            # Links both ways between two elements add up to one
+            key = tuple(sorted((owner[self.index[source]],
+                                owner[self.index[dest]])))
+            if key[0] != key[1]:
+                weights[key] = weights.get(key, 0) + 1
+        ids = [node["id"] for node in nodes]
+        return {
+            "version": version,
+            "level": level,
+            "levels": self.levels(),
+            "nodes": nodes,
+            "edges": [{"from": ids[source], "to": ids[dest], "weight": weight}
+                      for (source, dest), weight in sorted(weights.items())],
+        }
+
+
+class GraphClusters(GraphJob):
+    def __init__(self, graph_store):
+        # Hierarchy of the graph the last run was for
+        self.hierarchy = None
+        super().__init__(graph_store)
+
+    def prepare(self, graph):
+        ids, edges = self.indexed_edges(graph)
+        return compute_clusters, (len(ids), edges)
+
+    def finish(self, graph, levels):
+        hierarchy = Hierarchy(graph, list(graph.nodes), levels)
+        with self.finished:
+            self.hierarchy = hierarchy
+            self.finished.notify_all()
+
+    def get(self, timeout):
+        # (graph, hierarchy) for the current graph, None when it isn't
+        # ready within timeout. Graphs differing only in titles or tags
+        # share the hierarchy.
+        graph = self.graph_store.get()
+        with self.finished:
+            if self.finished.wait_for(
+                    lambda: (self.hierarchy is not None
+                             and not self.changed(self.hierarchy.graph,
+                                                  graph)),
+                    timeout):
+                return graph, self.hierarchy
+        return None
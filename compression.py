@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import gzip
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics import cache_lookups
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies are sent as they are
+MIN_COMPRESS_SIZE = 1024
+# Compressed dynamic bodies kept around for repeated requests
+MAX_CACHED_BODIES = 16
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/msgpack",
+    "image/svg+xml",
+    "image/x-icon",
+)
+
+
+def supported_encodings():
+    # In order of preference
+    if brotli is not None:
+        return ["br", "gzip"]
+    return ["gzip"]
+
+
+def negotiate(accept_encoding):
+    # Best encoding client accepts or None for identity
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parts[1:]:
+            key, _, value = parameter.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in supported_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best = encoding
+            best_quality = quality
+    return best
+
+
+def is_compressible(content_type, size):
+    return (size >= MIN_COMPRESS_SIZE
+            and content_type.startswith(COMPRESSIBLE_TYPES))
+
+
+def compress(data, encoding, best=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def make_etag(data):
+    return '"' + hashlib.sha1(data).hexdigest()[:24] + '"'
+
+
+def encoded_etag(etag, encoding):
+    # Every representation gets its own strong validator
+    if encoding is None:
+        return etag
+    return etag[:-1] + "-" + encoding + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class EncodedBodies:
+    def __init__(self):
+        # (etag, encoding) -> compressed body, least recently used first
+        self.bodies = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, etag, encoding, data):
+        key = (etag, encoding)
+        with self.lock:
+            if key in self.bodies:
+                self.bodies.move_to_end(key)
+                cache_lookups.inc("compressed", "hit")
+                return self.bodies[key]
+        cache_lookups.inc("compressed", "miss")
+        body = compress(data, encoding)
+        with self.lock:
+            self.bodies[key] = body
+            while len(self.bodies) > MAX_CACHED_BODIES:
+                self.bodies.popitem(last=False)
+        return body
+
+
+class StreamCompressor:
+    # Compresses a body handed over in pieces
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=5)
+        else:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from metrics import db_query_duration
+
+# Prepared statements kept by every connection
+CACHED_STATEMENTS = 64
+MMAP_SIZE = 256 * 1024 * 1024
+
+ELISP_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"', re.S)
+ELISP_ESCAPE = re.compile(r'\\(.)', re.S)
+
+
+def quote_string(value):
+    # Strings are stored in org-roam DB printed as elisp strings
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def unquote_string(value):
+    if value is None:
+        return None
+    match = ELISP_STRING.match(value.strip())
+    if not match:
+        return value
+    return ELISP_ESCAPE.sub(r"\1", match.group(1))
+
+
+def parse_strings(value):
+    # All strings in printed elisp list, e.g. ("tag" "other tag")
+    if not value:
+        return []
+    return [ELISP_ESCAPE.sub(r"\1", match)
+            for match in ELISP_STRING.findall(value)]
+
+
+class Database:
+    def __init__(self, path, watcher):
+        self.path = path
+        # Bumped whenever DB file is replaced, connections opened
+        # for older generation are dropped instead of reused.
+        self.generation = 0
+        self.inode = self.current_inode()
+        self.idle = []
+        self.lock = threading.Lock()
+        self.watcher = watcher
+        # Called when DB changes, also after it moved to another path
+        self.callbacks = []
+        self.subscribe(self.check_replaced)
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+            path = self.path
+        self.watcher.subscribe(path, callback)
+
+    def relocate(self, path):
+        # Switch to DB at another path, e.g. when org-roam-db-location
+        # changes in Emacs
+        with self.lock:
+            if path == self.path:
+                return
+            old, self.path = self.path, path
+            self.inode = self.current_inode()
+            self.generation += 1
+            stale, self.idle = self.idle, []
+            callbacks = list(self.callbacks)
+        for conn in stale:
+            conn.close()
+        for callback in callbacks:
+            self.watcher.unsubscribe(old, callback)
+            self.watcher.subscribe(path, callback)
+        for callback in callbacks:
+            callback()
+
+    def current_inode(self):
+        try:
+            return os.stat(self.path).st_ino
+        except OSError:
+            return None
+
+    def check_replaced(self):
+        inode = self.current_inode()
+        with self.lock:
+            if inode == self.inode:
+                return
+            self.inode = inode
+            self.generation += 1
+            stale, self.idle = self.idle, []
+        for conn in stale:
+            conn.close()
+
+    def connect(self):
+        uri = "file:" + urllib.parse.quote(str(self.path)) + "?mode=ro"
+        # Connection is handed between request threads,
+        # but only ever used by one thread at a time.
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA mmap_size = %d" % MMAP_SIZE)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self.lock:
+            generation = self.generation
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self.connect()
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        with self.lock:
+            if generation == self.generation:
+                self.idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def execute(self, query, parameters=()):
+        with self.connection() as conn, db_query_duration.time():
+            return conn.execute(query, parameters).fetchall()
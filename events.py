@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import re
+
+# Streamed /roam-data and /current-buffer-data responses send a comment
+# every HEARTBEAT_INTERVAL seconds without changes,
+# so connections of closed browser tabs are noticed and dropped.
+HEARTBEAT_INTERVAL = 15
+
+KEEP_ALIVE = ": keep-alive\n\n"
+
+# Graph changes are sent at most once per EVENT_INTERVAL seconds to
+# each stream, changes coming in between go out together as one diff
+EVENT_INTERVAL = 1
+
+
+# Any of them ends a field in the stream, so values are split on them
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+def format_data(data):
+    # Browser joins the lines back with "\n"
+    return "".join("data: " + line + "\n" for line in LINE_BREAK.split(data))
+
+
+def format_event(event_id, data):
+    return "id: " + event_id + "\n" + format_data(data) + "\n"
+
+
+def format_named_event(event, data):
+    # Without id, Last-Event-ID of the stream stays what it was
+    return "event: " + event + "\n" + format_data(data) + "\n"
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from payload import columnar_snapshot, encode_chunks
+from preview import PreviewError, wrap_preview, render_body
+from response.roamBufferHandler import roam_buffer_page
+from worker import pool_context
+
+# Bumping it makes the next export render every note again,
+# needed whenever the exported pages change
+EXPORT_VERSION = 2
+MANIFEST = "manifest.json"
+# Notes sent to a worker process at once, one by one the round trips
+# take longer than rendering
+BATCH_SIZE = 64
+# Tells templates/index.html it's served as plain files
+STATIC_MARKER = b'<meta name="static-site" content="1">'
+# Links to other notes keep the path of the org file, pages of all
+# notes of a vault are written to one directory
+NOTE_LINK = re.compile(
+    r'href="(?![\w+.-]*:)[^"#]*/([^"/#]+\.html(?:#[^"]*)?)"')
+# Assets the server serves on /, the export keeps them in the top directory
+ASSET_URL = re.compile(rb'((?:href|src)=\s*")/')
+
+
+def digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def write_file(path, data):
+    # Written next to its place and renamed, so a web server serving
+    # the directory never sends a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def flatten_links(body):
+    return NOTE_LINK.sub(r'href="\1"', body)
+
+
+def relative_assets(template, prefix):
+    return ASSET_URL.sub(lambda match: match.group(1) + prefix, template)
+
+
+def export_notes(notes):
+    # Runs in a worker process. notes are (source, title, target),
+    # returns checksums of the written pages, or errors
+    results = []
+    for source, title, target in notes:
+        try:
+            data = wrap_preview(
+                title, flatten_links(render_body(source))).encode("utf8")
+            write_file(target, data)
+        except (OSError, PreviewError) as e:
+            results.append((None, str(e)))
+        else:
+            results.append((digest(data), None))
+    return results
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), "r",
+                  encoding="utf8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(manifest, dict)
+            or manifest.get("version") != EXPORT_VERSION):
+        return None
+    return manifest
+
+
+class Site:
+    # Files exported to one directory and what they were made from.
+    # Whatever the previous export wrote and this one didn't is removed.
+    def __init__(self, directory):
+        self.directory = directory
+        previous = load_manifest(directory) or {}
+        self.previous_files = previous.get("files", {})
+        self.previous_notes = previous.get("notes", {})
+        # name relative to directory -> checksum of contents
+        self.files = {}
+        # node id -> source file, its mtime and size, and title
+        self.notes = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, *name.split("/"))
+
+    def exists(self, name):
+        return (name in self.previous_files
+                and os.path.isfile(self.path(name)))
+
+    def write(self, name, data):
+        # Unchanged files are left alone, so their mtime stays
+        if isinstance(data, str):
+            data = data.encode("utf8")
+        checksum = digest(data)
+        if self.previous_files.get(name) != checksum or not self.exists(name):
+            write_file(self.path(name), data)
+        self.files[name] = checksum
+
+    def finish(self):
+        for name in self.previous_files.keys() - self.files.keys():
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+        write_file(self.path(MANIFEST), json.dumps({
+            "version": EXPORT_VERSION,
+            "exported": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "notes": self.notes,
+            "files": self.files,
+        }, ensure_ascii=False, indent=1, sort_keys=True).encode("utf8"))
+
+
+def export_vault(vault, site, pool, endpoints, template, assets):
+    # (rendered, unchanged) numbers of notes
+    graph_store = vault.graph_store
+    graph = graph_store.get_current()
+    pending = []
+    unchanged = 0
+    for node_id, path in sorted(graph_store.notes().items()):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(e)
+            continue
+        title = graph.title(path)
+        note = {"source": path, "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size, "title": title}
+        name = node_id + ".html"
+        site.write("org-roam-buffer/" + name, roam_buffer_page(
+            title, vault.backlinks_cache.get(path)))
+        if site.previous_notes.get(node_id) == note and site.exists(name):
+            site.files[name] = site.previous_files[name]
+            site.notes[node_id] = note
+            unchanged += 1
+            continue
+        pending.append((node_id, name, note))
+
+    futures = {}
+    for start in range(0, len(pending), BATCH_SIZE):
+        batch = pending[start:start + BATCH_SIZE]
+        future = pool.submit(export_notes, [
+            (note["source"], note["title"], site.path(name))
+            for node_id, name, note in batch])
+        futures[future] = batch
+    rendered = 0
+    for future in as_completed(futures):
+        batch = futures[future]
+        for (node_id, name, note), (checksum, error) in zip(
+                batch, future.result()):
+            if error is not None:
+                # Left out of the manifest, so it's tried again next time
+                print(error)
+                continue
+            site.files[name] = checksum
+            site.notes[node_id] = note
+            rendered += 1
+
+    version = graph_store.format_version(graph.version)
+    site.write("roam-data.json", "".join(
+        encode_chunks(columnar_snapshot(graph, version), "columnar")))
+    for name, data in endpoints.items():
+        site.write(name, data)
+    site.write("index.html", relative_assets(template, assets).replace(
+        b'<meta charset="utf-8">',
+        b'<meta charset="utf-8">\n    ' + STATIC_MARKER, 1))
+    return rendered, unchanged
+
+
+def export_site(directory, default_vault, vaults, endpoints, template,
+                assets_dir, workers=None):
+    # Writes the default vault with assets to directory and other vaults
+    # to directory/vault/NAME, the paths the server serves them on.
+    # Returns (rendered, unchanged) numbers of notes.
+    started = time.time()
+    sites = [(default_vault, Site(directory))]
+    sites.extend((vault, Site(os.path.join(directory, "vault", vault.name)))
+                 for vault in vaults)
+    for entry in sorted(os.scandir(assets_dir), key=lambda entry: entry.name):
+        if entry.is_file():
+            with open(entry.path, "rb") as f:
+                sites[0][1].write(entry.name, f.read())
+    totals = [0, 0]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             mp_context=pool_context()) as pool:
+        for vault, site in sites:
+            # Path of the top directory from the one of the vault
+            assets = os.path.relpath(directory, site.directory)
+            assets = "" if assets == "." else assets.replace(os.sep, "/") + "/"
+            rendered, unchanged = export_vault(vault, site, pool, endpoints,
+                                               template, assets.encode())
+            site.finish()
+            totals[0] += rendered
+            totals[1] += unchanged
+            print("Exported vault %s to %s: %d notes rendered, %d unchanged"
+                  % (vault.name, site.directory, rendered, unchanged))
+    print("Export took %.1fs" % (time.time() - started))
+    return tuple(totals)
@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import time
+import bisect
+import threading
+import urllib.parse
+from collections import deque
+import snapshot
+from admission import SingleFlight
+from database import unquote_string, parse_strings
+from metrics import cache_lookups
+
+# How many diffs are kept around for clients which are catching up.
+# Clients older than that receive full snapshot instead.
+MAX_HISTORY = 32
+
+# Snapshot is written once the graph didn't change for this many seconds
+SNAPSHOT_DELAY = 5
+
+FILE_LINK = re.compile(r"\[\[file:(.+?)(?:\]\[(.*?))?\]\]", re.S)
+
+
+def path_to_id(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def parse_tags(tags):
+    return parse_strings(tags) or None
+
+
+class Node:
+    __slots__ = ("id", "path", "title", "tags")
+
+    def __init__(self, path, title, tags):
+        self.id = path_to_id(path)
+        self.path = path
+        self.title = title
+        self.tags = tags
+
+    def __eq__(self, other):
+        return (isinstance(other, Node)
+                and self.path == other.path
+                and self.title == other.title
+                and self.tags == other.tags)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "tags": self.tags,
+            "label": self.title,
+            "url": "org-protocol://roam-file?file="
+            + urllib.parse.quote_plus(self.path),
+            "path": self.path,
+        }
+
+
+class Edge:
+    __slots__ = ("source", "dest")
+
+    def __init__(self, source, dest):
+        self.source = source
+        self.dest = dest
+
+    def key(self):
+        return (self.source, self.dest)
+
+    def to_dict(self):
+        return {"from": self.source, "to": self.dest, "arrows": None}
+
+
+class Backlink:
+    __slots__ = ("source", "title", "links")
+
+    def __init__(self, source, title):
+        self.source = source
+        self.title = title
+        # (target file name, description) of links in the context
+        self.links = []
+
+    def __eq__(self, other):
+        return (isinstance(other, Backlink)
+                and self.source == other.source
+                and self.title == other.title
+                and self.links == other.links)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def add_context(self, content):
+        for target, description in FILE_LINK.findall(content):
+            target = os.path.basename(target)
+            self.links.append((target, description or target))
+
+
+class Graph:
+    __slots__ = ("version", "nodes", "edges", "by_path", "neighbours",
+                 "backlinks", "by_tag", "sorted_paths", "positions")
+
+    def __init__(self, version=0):
+        self.version = version
+        # node id -> Node
+        self.nodes = {}
+        # (source id, dest id) -> Edge
+        self.edges = {}
+        # full path -> Node
+        self.by_path = {}
+        # node id -> ids of nodes linked from or to it
+        self.neighbours = {}
+        # dest path -> Backlinks from every source linking to it
+        self.backlinks = {}
+        # tag -> ids of nodes tagged with it
+        self.by_tag = {}
+        # all node paths sorted, for prefix lookups
+        self.sorted_paths = []
+        # node id -> (x, y) computed by the layout worker
+        self.positions = {}
+
+    def copy(self, version):
+        # Shares everything, the graph itself is never modified once built
+        graph = Graph(version)
+        for slot in Graph.__slots__:
+            setattr(graph, slot, getattr(self, slot))
+        graph.version = version
+        return graph
+
+    def node_dict(self, node):
+        result = node.to_dict()
+        position = self.positions.get(node.id)
+        if position is not None:
+            result["x"], result["y"] = position
+        return result
+
+    def add_node(self, node):
+        # The first title of a file wins, other rows are its aliases
+        if node.id not in self.nodes:
+            self.nodes[node.id] = node
+            self.by_path[node.path] = node
+            for tag in node.tags or ():
+                self.by_tag.setdefault(tag, set()).add(node.id)
+
+    def add_edge(self, edge):
+        self.edges[edge.key()] = edge
+        self.neighbours.setdefault(edge.source, set()).add(edge.dest)
+        self.neighbours.setdefault(edge.dest, set()).add(edge.source)
+
+    def add_backlink(self, source, dest, content, found):
+        # found maps (dest, source) to Backlinks added so far, kept by
+        # the caller while building, so hub notes don't scan their list
+        backlink = found.get((dest, source))
+        if backlink is None:
+            backlink = found[dest, source] = Backlink(source,
+                                                      self.title(source))
+            self.backlinks.setdefault(dest, []).append(backlink)
+        backlink.add_context(content)
+
+    def title(self, path):
+        node = self.by_path.get(path)
+        return node.title if node is not None else ""
+
+    def degree(self, node_id):
+        return len(self.neighbours.get(node_id, ()))
+
+    def neighbourhood(self, root, depth):
+        # Ids of nodes at most depth links away from root, closest first
+        if root not in self.nodes:
+            return []
+        seen = {root}
+        found = [root]
+        frontier = [root]
+        for _ in range(depth):
+            next_frontier = []
+            for node_id in frontier:
+                for neighbour in self.neighbours.get(node_id, ()):
+                    if neighbour not in seen and neighbour in self.nodes:
+                        seen.add(neighbour)
+                        next_frontier.append(neighbour)
+            if not next_frontier:
+                break
+            found.extend(next_frontier)
+            frontier = next_frontier
+        return found
+
+    def under_path(self, prefix):
+        # Ids of nodes whose path starts with prefix
+        ids = []
+        start = bisect.bisect_left(self.sorted_paths, prefix)
+        for index in range(start, len(self.sorted_paths)):
+            path = self.sorted_paths[index]
+            if not path.startswith(prefix):
+                break
+            ids.append(self.by_path[path].id)
+        return ids
+
+    def edges_between(self, ids):
+        # Edges with both ends among ids
+        ids = set(ids)
+        edges = []
+        for node_id in ids:
+            for neighbour in self.neighbours.get(node_id, ()):
+                if neighbour in ids:
+                    edge = self.edges.get((node_id, neighbour))
+                    if edge is not None:
+                        edges.append(edge)
+        return edges
+
+
+def path_order(path):
+    # Ambiguous names resolve to the least nested, then alphabetically first
+    return (path.count(os.sep), path)
+
+
+class PathIndex:
+    __slots__ = ("files", "by_basename", "by_id")
+
+    def __init__(self):
+        self.files = set()
+        # file name -> full paths sorted by path_order
+        self.by_basename = {}
+        # node id -> full paths sorted by path_order
+        self.by_id = {}
+
+    def refresh(self, files):
+        # Only names of added or removed files are touched
+        files = set(files)
+        for path in self.files - files:
+            self.remove(self.by_basename, os.path.basename(path), path)
+            self.remove(self.by_id, path_to_id(path), path)
+        for path in files - self.files:
+            self.add(self.by_basename, os.path.basename(path), path)
+            self.add(self.by_id, path_to_id(path), path)
+        self.files = files
+
+    def add(self, index, name, path):
+        paths = index.setdefault(name, [])
+        paths.append(path)
+        paths.sort(key=path_order)
+
+    def remove(self, index, name, path):
+        paths = index[name]
+        paths.remove(path)
+        if not paths:
+            del index[name]
+
+    def find(self, name):
+        paths = self.by_basename.get(name) or self.by_id.get(name)
+        return paths[0] if paths else None
+
+    def to_data(self):
+        return {
+            "files": sorted(self.files),
+            "by_basename": {name: list(paths)
+                            for name, paths in self.by_basename.items()},
+            "by_id": {name: list(paths)
+                      for name, paths in self.by_id.items()},
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        index = cls()
+        index.files = set(data["files"])
+        index.by_basename = data["by_basename"]
+        index.by_id = data["by_id"]
+        return index
+
+
+def build_graph(database, version):
+    graph = Graph(version)
+
+    tags = {file: parse_tags(file_tags) for file, file_tags
+            in database.execute("SELECT file, tags FROM tags")}
+
+    for file, title in database.execute("SELECT file, title FROM titles"):
+        graph.add_node(Node(unquote_string(file),
+                            unquote_string(title) or "",
+                            tags.get(file)))
+
+    edges_query = """WITH selected AS (SELECT file FROM files)
+                    SELECT DISTINCT [source],[dest]
+                    FROM links
+                    WHERE [dest] IN selected AND [source] IN selected"""
+    for source, dest in database.execute(edges_query):
+        graph.add_edge(Edge(path_to_id(unquote_string(source)),
+                            path_to_id(unquote_string(dest))))
+
+    links_query = "SELECT [source], [dest], [properties] FROM links"
+    found = {}
+    for source, dest, properties in database.execute(links_query):
+        graph.add_backlink(unquote_string(source), unquote_string(dest),
+                           " ".join(parse_strings(properties)), found)
+
+    graph.sorted_paths = sorted(graph.by_path)
+    return graph
+
+
+def graph_to_data(graph):
+    # Plain lists and dicts of everything build_graph produces,
+    # which graph_from_data turns back into the same graph
+    return {
+        "nodes": [[node.path, node.title, node.tags]
+                  for node in graph.nodes.values()],
+        "edges": [[edge.source, edge.dest] for edge in graph.edges.values()],
+        "backlinks": [
+            [dest, [[backlink.source, backlink.title, backlink.links]
+                    for backlink in backlinks]]
+            for dest, backlinks in graph.backlinks.items()],
+        "positions": [[node_id, x, y]
+                      for node_id, (x, y) in graph.positions.items()],
+    }
+
+
+def graph_from_data(data, version):
+    graph = Graph(version)
+    for path, title, tags in data["nodes"]:
+        graph.add_node(Node(path, title, tags))
+    for source, dest in data["edges"]:
+        graph.add_edge(Edge(source, dest))
+    for dest, backlinks in data["backlinks"]:
+        graph.backlinks[dest] = []
+        for source, title, links in backlinks:
+            backlink = Backlink(source, title)
+            backlink.links = [tuple(link) for link in links]
+            graph.backlinks[dest].append(backlink)
+    graph.positions = {node_id: (x, y) for node_id, x, y in data["positions"]}
+    graph.sorted_paths = sorted(graph.by_path)
+    return graph
+
+
+def empty_diff():
+    return {
+        "add": {"nodes": [], "edges": []},
+        "update": {"nodes": []},
+        "remove": {"nodes": [], "edges": []},
+    }
+
+
+def diff_graphs(old, new):
+    diff = empty_diff()
+
+    for node_id, node in new.nodes.items():
+        old_node = old.nodes.get(node_id)
+        if old_node is None:
+            diff["add"]["nodes"].append(new.node_dict(node))
+        elif (old_node != node
+              or old.positions.get(node_id) != new.positions.get(node_id)):
+            diff["update"]["nodes"].append(new.node_dict(node))
+    for node_id in old.nodes:
+        if node_id not in new.nodes:
+            diff["remove"]["nodes"].append(node_id)
+
+    for key, edge in new.edges.items():
+        if key not in old.edges:
+            diff["add"]["edges"].append(edge.to_dict())
+    for key in old.edges:
+        if key not in new.edges:
+            diff["remove"]["edges"].append({"from": key[0], "to": key[1]})
+
+    return diff
+
+
+def merge_diffs(diffs):
+    # For every touched node and edge remember whether it existed
+    # before the first diff and what its final state is.
+    nodes = {}
+    edges = {}
+
+    for diff in diffs:
+        for node in diff["add"]["nodes"]:
+            existed = nodes[node["id"]][0] if node["id"] in nodes else False
+            nodes[node["id"]] = (existed, node)
+        for node in diff["update"]["nodes"]:
+            existed = nodes[node["id"]][0] if node["id"] in nodes else True
+            nodes[node["id"]] = (existed, node)
+        for node_id in diff["remove"]["nodes"]:
+            existed = nodes[node_id][0] if node_id in nodes else True
+            nodes[node_id] = (existed, None)
+        for edge in diff["add"]["edges"]:
+            key = (edge["from"], edge["to"])
+            existed = edges[key][0] if key in edges else False
+            edges[key] = (existed, edge)
+        for edge in diff["remove"]["edges"]:
+            key = (edge["from"], edge["to"])
+            existed = edges[key][0] if key in edges else True
+            edges[key] = (existed, None)
+
+    merged = empty_diff()
+    for node_id, (existed, node) in nodes.items():
+        if node is None:
+            if existed:
+                merged["remove"]["nodes"].append(node_id)
+        elif existed:
+            merged["update"]["nodes"].append(node)
+        else:
+            merged["add"]["nodes"].append(node)
+    for (source, dest), (existed, edge) in edges.items():
+        if edge is None:
+            if existed:
+                merged["remove"]["edges"].append({"from": source, "to": dest})
+        elif not existed:
+            merged["add"]["edges"].append(edge)
+
+    return merged
+
+
+class GraphStore:
+    def __init__(self, database, snapshot_path=None):
+        self.database = database
+        self.snapshot_path = snapshot_path
+        # Every server run gets its own epoch so versions from previous run
+        # are never mistaken for current ones.
+        self.epoch = str(int(time.time()))
+        self.graph = Graph()
+        self.history = deque(maxlen=MAX_HISTORY)
+        self.paths = PathIndex()
+        self.listeners = []
+        self.dirty = True
+        # Counts invalidations, so changes made while a build runs
+        # leave the graph dirty
+        self.generation = 0
+        # Requests coming while the graph is built wait for that build
+        self.builds = SingleFlight("graph")
+        # Set while a rebuild runs in the background, requests are
+        # served from the current graph meanwhile
+        self.refreshing = False
+        # DB stamp the current graph was built from
+        self.stamp = None
+        self.saving = False
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        database.subscribe(self.invalidate)
+        if snapshot_path is not None:
+            self.load_snapshot()
+
+    def load_snapshot(self):
+        # Graph of the previous run is served right away, rebuilt
+        # in the background when DB changed since
+        loaded = snapshot.load(self.snapshot_path, self.database.path)
+        if loaded is None:
+            return
+        stamp, data = loaded
+        try:
+            graph = graph_from_data(data["graph"], 1)
+            paths = PathIndex.from_data(data["paths"])
+        except (KeyError, TypeError, ValueError) as e:
+            print("Ignoring graph snapshot %s: %s" % (self.snapshot_path, e))
+            return
+        with self.lock:
+            self.paths = paths
+            self.stamp = stamp
+            self.dirty = False
+            self.publish(Graph(), graph)
+            if stamp == snapshot.db_stamp(self.database.path):
+                return
+            self.refreshing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        built = False
+        try:
+            stamp = snapshot.db_stamp(self.database.path)
+            files, graph = self.build()
+            with self.lock:
+                self.install(stamp, files, graph)
+            built = True
+        finally:
+            with self.lock:
+                self.refreshing = False
+                if not built:
+                    # Next request rebuilds instead of serving the snapshot
+                    self.dirty = True
+                self.changed.notify_all()
+
+    def invalidate(self):
+        with self.lock:
+            self.dirty = True
+            self.generation += 1
+            self.changed.notify_all()
+
+    def get(self):
+        with self.lock:
+            if not self.dirty or self.refreshing:
+                cache_lookups.inc("graph", "hit")
+                return self.graph
+        return self.builds.do(None, self.rebuild)
+
+    def get_current(self):
+        # Like get, but waits for a background refresh rather than
+        # answering with the graph of the previous run
+        with self.lock:
+            while self.refreshing:
+                self.changed.wait()
+        return self.get()
+
+    def wait(self, version, timeout):
+        # Block until graph newer than version is available or timeout passes
+        with self.lock:
+            if not self.dirty and self.graph.version == version:
+                self.changed.wait(timeout)
+        return self.get()
+
+    def subscribe(self, callback):
+        # callback(old graph, new graph) is called with the store locked
+        # after every rebuild which produced new version
+        self.listeners.append(callback)
+
+    def find_path(self, name):
+        # Full path of a note by its file name or id, None when unknown
+        self.get()
+        with self.lock:
+            return self.paths.find(name)
+
+    def notes(self):
+        # node id -> full path of every file in the DB, the one
+        # find_path picks for ambiguous ids
+        self.get()
+        with self.lock:
+            return {node_id: paths[0]
+                    for node_id, paths in self.paths.by_id.items()}
+
+    def rebuild(self):
+        # Built without holding the lock, so readers which don't
+        # need the new graph, like streams waiting for changes, go on
+        with self.lock:
+            if not self.dirty:
+                return self.graph
+            generation = self.generation
+        cache_lookups.inc("graph", "miss")
+        stamp = snapshot.db_stamp(self.database.path)
+        files, graph = self.build()
+        with self.lock:
+            self.install(stamp, files, graph)
+            self.dirty = self.generation != generation
+            return self.graph
+
+    def build(self):
+        files = self.database.execute("SELECT file FROM files")
+        return ([unquote_string(row[0]) for row in files],
+                build_graph(self.database, 0))
+
+    def install(self, stamp, files, graph):
+        # Called with lock held
+        self.paths.refresh(files)
+        self.stamp = stamp
+        self.save_later()
+        old = self.graph
+        graph.version = old.version + 1
+        # Known nodes keep their place until the layout catches up
+        graph.positions = {node_id: position
+                           for node_id, position in old.positions.items()
+                           if node_id in graph.nodes}
+        if old.version > 0:
+            diff = diff_graphs(old, graph)
+            if diff == empty_diff() and old.backlinks == graph.backlinks:
+                # DB was written but nothing we serve has changed
+                return
+            self.history.append((graph.version, diff))
+        self.publish(old, graph)
+
+    def publish(self, old, graph):
+        self.graph = graph
+        for callback in self.listeners:
+            callback(old, graph)
+
+    def update_positions(self, positions):
+        # New version of the current graph with node coordinates replaced
+        with self.lock:
+            old = self.graph
+            graph = old.copy(old.version + 1)
+            graph.positions = dict(old.positions)
+            graph.positions.update(
+                (node_id, position) for node_id, position in positions.items()
+                if node_id in old.nodes)
+            diff = diff_graphs(old, graph)
+            if diff == empty_diff():
+                return
+            self.history.append((graph.version, diff))
+            self.publish(old, graph)
+            self.save_later()
+            self.changed.notify_all()
+
+    def save_later(self):
+        # Called with lock held, bursts of changes are saved once
+        if self.snapshot_path is None or self.saving:
+            return
+        self.saving = True
+        timer = threading.Timer(SNAPSHOT_DELAY, self.save_snapshot)
+        timer.daemon = True
+        timer.start()
+
+    def save_snapshot(self):
+        with self.lock:
+            self.saving = False
+            if self.graph.version == 0:
+                return
+            stamp, graph, paths = self.stamp, self.graph, self.paths.to_data()
+        # Graph is replaced, never modified, so it can be converted
+        # without holding the lock
+        try:
+            snapshot.save(self.snapshot_path, self.database.path, stamp,
+                          {"graph": graph_to_data(graph), "paths": paths})
+        except OSError as e:
+            print("Saving graph snapshot failed:", e)
+
+    def format_version(self, version):
+        return "%s-%d" % (self.epoch, version)
+
+    def parse_version(self, version_id):
+        if not version_id:
+            return None
+        try:
+            epoch, version = version_id.rsplit("-", 1)
+            version = int(version)
+        except ValueError:
+            return None
+        if epoch != self.epoch:
+            return None
+        return version
+
+    def diff_since(self, version, graph):
+        # Merged diff leading from version to graph.version or None
+        # when the history doesn't reach that far back.
+        with self.lock:
+            if version > graph.version:
+                return None
+            if graph.version - version > len(self.history):
+                return None
+            diffs = [diff for diff_version, diff in self.history
+                     if version < diff_version <= graph.version]
+        if len(diffs) != graph.version - version:
+            return None
+        return merge_diffs(diffs)
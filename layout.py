@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import math
+import random
+from worker import GraphJob
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Ideal distance between linked nodes, in vis-network coordinates
+EDGE_LENGTH = 100.0
+FULL_ITERATIONS = 80
+INCREMENTAL_ITERATIONS = 30
+# Up to this many nodes repulsion is computed between every pair,
+# bigger graphs approximate far away nodes by centroids of grid cells.
+EXACT_REPULSION_LIMIT = 2000
+NODES_PER_CELL = 64
+CHUNK_SIZE = 2048
+
+
+def initial_positions(positions, edges, count):
+    # Nodes without position start next to their placed neighbours
+    # or at random spot of a disk big enough for the whole graph
+    radius = EDGE_LENGTH * math.sqrt(count)
+    rng = random.Random(count)
+    neighbours = [[] for _ in range(count)]
+    for source, dest in edges:
+        neighbours[source].append(dest)
+        neighbours[dest].append(source)
+
+    result = list(positions)
+    for index in range(count):
+        if result[index] is not None:
+            continue
+        placed = [positions[other] for other in neighbours[index]
+                  if positions[other] is not None]
+        if placed:
+            x = sum(p[0] for p in placed) / len(placed)
+            y = sum(p[1] for p in placed) / len(placed)
+            result[index] = (x + rng.uniform(-EDGE_LENGTH, EDGE_LENGTH),
+                             y + rng.uniform(-EDGE_LENGTH, EDGE_LENGTH))
+        else:
+            angle = rng.uniform(0, 2 * math.pi)
+            distance = radius * math.sqrt(rng.random())
+            result[index] = (distance * math.cos(angle),
+                             distance * math.sin(angle))
+    return result
+
+
+def compute_layout(positions, edges, fixed, iterations):
+    # Fruchterman-Reingold layout.
+    # positions: (x, y) or None for every node, edges: (index, index) pairs,
+    # fixed: nodes which must not move. Returns (x, y) for every node.
+    count = len(positions)
+    if count == 0:
+        return []
+    positions = initial_positions(positions, edges, count)
+    if all(fixed):
+        return positions
+    if all(not f for f in fixed):
+        temperature = EDGE_LENGTH * math.sqrt(count) / 10
+    else:
+        temperature = EDGE_LENGTH * 2
+    if numpy is not None:
+        return layout_numpy(positions, edges, fixed, iterations, temperature)
+    return layout_python(positions, edges, fixed, iterations, temperature)
+
+
+def layout_numpy(positions, edges, fixed, iterations, temperature):
+    pos = numpy.array(positions, dtype=float)
+    movable = ~numpy.array(fixed, dtype=bool)
+    sources = numpy.array([edge[0] for edge in edges], dtype=int)
+    dests = numpy.array([edge[1] for edge in edges], dtype=int)
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        disp = repulsion_numpy(pos)
+        if len(sources):
+            delta = pos[dests] - pos[sources]
+            distance = numpy.sqrt((delta ** 2).sum(axis=1)) + 0.01
+            force = delta * (distance / EDGE_LENGTH)[:, None]
+            numpy.add.at(disp, sources, force)
+            numpy.subtract.at(disp, dests, force)
+        length = numpy.sqrt((disp ** 2).sum(axis=1)) + 1e-9
+        step = numpy.minimum(length, temperature) / length
+        pos[movable] += (disp * step[:, None])[movable]
+        temperature -= cooling
+
+    return [tuple(p) for p in pos.tolist()]
+
+
+def repulsion_numpy(pos):
+    count = len(pos)
+    k2 = EDGE_LENGTH * EDGE_LENGTH
+    if count <= EXACT_REPULSION_LIMIT:
+        return pairwise_repulsion_numpy(pos)
+
+    side = max(2, int(math.sqrt(count / NODES_PER_CELL)))
+    lowest = pos.min(axis=0)
+    span = pos.max(axis=0) - lowest + 1e-9
+    cell_xy = numpy.minimum(((pos - lowest) / span * side).astype(int), side - 1)
+    cells = cell_xy[:, 0] * side + cell_xy[:, 1]
+    cell_count = side * side
+    mass = numpy.bincount(cells, minlength=cell_count).astype(float)
+    safe_mass = numpy.maximum(mass, 1)
+    centroids = numpy.stack([
+        numpy.bincount(cells, weights=pos[:, 0], minlength=cell_count),
+        numpy.bincount(cells, weights=pos[:, 1], minlength=cell_count),
+    ], axis=1) / safe_mass[:, None]
+
+    # Far field, every other cell acts as one heavy node in its centroid
+    disp = numpy.zeros_like(pos)
+    for start in range(0, count, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, count)
+        delta = pos[start:end, None, :] - centroids[None, :, :]
+        distance2 = (delta ** 2).sum(axis=2) + 0.01
+        weight = mass[None, :] * k2 / distance2
+        weight[numpy.arange(end - start), cells[start:end]] = 0
+        disp[start:end] = (delta * weight[:, :, None]).sum(axis=1)
+
+    # Near field, exact repulsion between nodes sharing a cell
+    order = numpy.argsort(cells, kind="stable")
+    bounds = numpy.searchsorted(cells[order], numpy.arange(cell_count + 1))
+    for cell in range(cell_count):
+        members = order[bounds[cell]:bounds[cell + 1]]
+        if len(members) > 1:
+            disp[members] += pairwise_repulsion_numpy(pos[members])
+    return disp
+
+
+def pairwise_repulsion_numpy(pos):
+    delta = pos[:, None, :] - pos[None, :, :]
+    distance2 = (delta ** 2).sum(axis=2) + 0.01
+    return (delta * (EDGE_LENGTH * EDGE_LENGTH / distance2)[:, :, None]).sum(axis=1)
+
+
+def layout_python(positions, edges, fixed, iterations, temperature):
+    # Grid variant of Fruchterman-Reingold, nodes repel only nodes
+    # from neighbouring cells, which keeps each iteration close to linear.
+    pos = [list(p) for p in positions]
+    count = len(pos)
+    cell_size = 2 * EDGE_LENGTH
+    k2 = EDGE_LENGTH * EDGE_LENGTH
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        disp = [[0.0, 0.0] for _ in range(count)]
+        grid = {}
+        for index, (x, y) in enumerate(pos):
+            grid.setdefault((int(x // cell_size), int(y // cell_size)),
+                            []).append(index)
+        for (gx, gy), members in grid.items():
+            near = [other
+                    for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                    for other in grid.get((gx + dx, gy + dy), ())]
+            for index in members:
+                if fixed[index]:
+                    continue
+                x, y = pos[index]
+                fx = fy = 0.0
+                for other in near:
+                    if other == index:
+                        continue
+                    dx = x - pos[other][0]
+                    dy = y - pos[other][1]
+                    distance2 = dx * dx + dy * dy + 0.01
+                    if distance2 < cell_size * cell_size:
+                        force = k2 / distance2
+                        fx += dx * force
+                        fy += dy * force
+                disp[index][0] += fx
+                disp[index][1] += fy
+
+        for source, dest in edges:
+            dx = pos[dest][0] - pos[source][0]
+            dy = pos[dest][1] - pos[source][1]
+            force = (math.sqrt(dx * dx + dy * dy) + 0.01) / EDGE_LENGTH
+            disp[source][0] += dx * force
+            disp[source][1] += dy * force
+            disp[dest][0] -= dx * force
+            disp[dest][1] -= dy * force
+
+        for index in range(count):
+            if fixed[index]:
+                continue
+            dx, dy = disp[index]
+            length = math.sqrt(dx * dx + dy * dy) + 1e-9
+            step = min(length, temperature) / length
+            pos[index][0] += dx * step
+            pos[index][1] += dy * step
+        temperature -= cooling
+
+    return [tuple(p) for p in pos]
+
+
+class LayoutStore(GraphJob):
+    def __init__(self, graph_store):
+        # Links of the graph the last run laid out
+        self.edges = None
+        super().__init__(graph_store)
+
+    def prepare(self, graph):
+        ids, edges = self.indexed_edges(graph)
+        positions = [graph.positions.get(node_id) for node_id in ids]
+
+        # Only nodes without position and their neighbours move, and
+        # ends of links added or removed since the last run
+        if any(position is not None for position in positions):
+            movable = set()
+            for node_id, position in zip(ids, positions):
+                if position is None:
+                    movable.add(node_id)
+                    movable.update(graph.neighbours.get(node_id, ()))
+            if self.edges is not None:
+                for source, dest in self.edges ^ graph.edges.keys():
+                    movable.add(source)
+                    movable.add(dest)
+            fixed = [node_id not in movable for node_id in ids]
+            iterations = INCREMENTAL_ITERATIONS
+        else:
+            fixed = [False] * len(ids)
+            iterations = FULL_ITERATIONS
+
+        return compute_layout, (positions, edges, fixed, iterations)
+
+    def finish(self, graph, positions):
+        self.edges = set(graph.edges)
+        self.graph_store.update_positions({
+            node_id: (round(x, 1), round(y, 1))
+            for node_id, (x, y) in zip(graph.nodes, positions)})
@@ -1,30 +1,87 @@
 #!/usr/bin/env python3
-import time
 import sys
-from http.server import HTTPServer
-from server import Server
+import time
+import argparse
+from http.server import HTTPServer, ThreadingHTTPServer
+import worker
 
 HOST_NAME = "localhost"
 PORT_NUMBER = 8080
 
 
-class QuietHandler(Server):
-    def log_message(self, format, *args):
-        pass
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", dest="debug", action="store_true",
+                        help="print full request log")
+    parser.add_argument("-p", "--port", type=int, default=PORT_NUMBER,
+                        help="port to listen on (default %d)" % PORT_NUMBER)
+    parser.add_argument("--single-threaded", action="store_true",
+                        help="serve one request at a time "
+                        "and answer event streams with one chunk")
+    parser.add_argument("--prerender", action="store_true",
+                        help="render previews of notes linked with "
+                        "the current buffer in the background")
+    parser.add_argument("--no-layout", dest="layout", action="store_false",
+                        help="leave node placement to the browser "
+                        "instead of computing it on the server")
+    parser.add_argument("--profile-slow", metavar="MS", type=float,
+                        help="profile requests and keep reports of those "
+                        "slower than MS milliseconds, served on /profiles")
+    parser.add_argument("--profile-mode", choices=["cprofile", "tracemalloc"],
+                        default="cprofile",
+                        help="record where the time (cprofile, default) "
+                        "or memory (tracemalloc) went")
+    parser.add_argument("--vault", nargs=3, action="append", default=[],
+                        metavar=("NAME", "DIRECTORY", "DB"),
+                        help="also serve org-roam DB with notes in DIRECTORY "
+                        "under /vault/NAME/, can be repeated")
+    parser.add_argument("--export", metavar="DIR",
+                        help="write previews, backlinks, graph data and "
+                        "assets of every vault to DIR and exit, "
+                        "notes which didn't change since the last "
+                        "export to DIR are skipped")
+    args = parser.parse_args()
 
+    if args.export:
+        # Statistics, clusters and layout aren't exported,
+        # the export doesn't wait for them before exiting
+        worker.disable()
+    # Worker processes import this module again, server opens
+    # vaults and settings on import so only the server process may
+    from server import (Server, QuietServer, enable_prerender,
+                        enable_layout, enable_profiling, add_vault,
+                        export_static)
 
-if __name__ == "__main__":
-    args = sys.argv[1:]
-    if args and args[0] == '-d':
-        httpd = HTTPServer((HOST_NAME, PORT_NUMBER), Server)
+    for name, directory, db_path in args.vault:
+        try:
+            add_vault(name, directory, db_path)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.export:
+        export_static(args.export)
+        sys.exit(0)
+    if args.prerender:
+        enable_prerender()
+    if args.layout:
+        enable_layout()
+    if args.profile_slow is not None:
+        enable_profiling(args.profile_slow / 1000, args.profile_mode)
+
+    handler = Server if args.debug else QuietServer
+    if args.single_threaded:
+        httpd = HTTPServer((HOST_NAME, args.port), handler)
+        httpd.streaming = False
     else:
-        httpd = HTTPServer((HOST_NAME, PORT_NUMBER), QuietHandler)
+        httpd = ThreadingHTTPServer((HOST_NAME, args.port), handler)
+        httpd.daemon_threads = True
+        httpd.streaming = True
+    if not args.debug:
         print(
             "If you want to see full request log, pass '-d' debug switch to this program.")
-    print(time.asctime(), "Server Starts - %s:%s" % (HOST_NAME, PORT_NUMBER))
+    print(time.asctime(), "Server Starts - %s:%s" % (HOST_NAME, args.port))
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     httpd.server_close()
-    print(time.asctime(), "Server Stops - %s:%s" % (HOST_NAME, PORT_NUMBER))
+    print(time.asctime(), "Server Stops - %s:%s" % (HOST_NAME, args.port))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import io
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds of histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                    0.5, 1, 2.5, 5, 10)
+# Slow request samples kept for /profiles
+MAX_PROFILES = 20
+PROFILE_LINES = 30
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\")
+                     .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        # label values -> count
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description),
+                 "# TYPE %s counter" % self.name]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append("%s%s %s" % (
+                    self.name, format_labels(self.labels, labels),
+                    format_value(value)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(),
+                 buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count in every bucket..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description),
+                 "# TYPE %s histogram" % self.name]
+        names = self.labels + ("le",)
+        with self.lock:
+            for labels, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (
+                        self.name,
+                        format_labels(names, labels + (format_value(bound),)),
+                        cumulative))
+                lines.append("%s_bucket%s %d" % (
+                    self.name, format_labels(names, labels + ("+Inf",)),
+                    counts[-1]))
+                lines.append("%s_sum%s %s" % (
+                    self.name, format_labels(self.labels, labels),
+                    format_value(counts[-2])))
+                lines.append("%s_count%s %d" % (
+                    self.name, format_labels(self.labels, labels), counts[-1]))
+        return lines
+
+
+requests = Counter(
+    "org_roam_server_requests_total",
+    "Requests answered, by handler and status.",
+    ("handler", "status"))
+request_duration = Histogram(
+    "org_roam_server_request_duration_seconds",
+    "Time until the response was sent, until the first event for streams.",
+    ("handler",))
+response_bytes = Counter(
+    "org_roam_server_response_bytes_total",
+    "Bytes of response bodies sent, by handler.",
+    ("handler",))
+db_query_duration = Histogram(
+    "org_roam_server_db_query_duration_seconds",
+    "Queries to the org-roam database.")
+pandoc_duration = Histogram(
+    "org_roam_server_pandoc_duration_seconds",
+    "Exports of previews by pandoc.")
+preview_renders = Counter(
+    "org_roam_server_preview_renders_total",
+    "Previews rendered, by renderer (python or pandoc).",
+    ("renderer",))
+cache_lookups = Counter(
+    "org_roam_server_cache_lookups_total",
+    "Lookups in server caches, by cache and result (hit or miss).",
+    ("cache", "result"))
+coalesced_calls = Counter(
+    "org_roam_server_coalesced_calls_total",
+    "Graph builds, preview renders and events not done again because "
+    "an identical one was in progress, by kind.",
+    ("kind",))
+rejected_requests = Counter(
+    "org_roam_server_rejected_requests_total",
+    "Requests answered with 503 because their endpoint was busy, by route.",
+    ("route",))
+
+METRICS = [requests, request_duration, response_bytes, db_query_duration,
+           pandoc_duration, preview_renders, cache_lookups, coalesced_calls,
+           rejected_requests]
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    lines.append("# HELP org_roam_server_cache_hit_ratio "
+                 "Share of cache lookups which were hits.")
+    lines.append("# TYPE org_roam_server_cache_hit_ratio gauge")
+    with cache_lookups.lock:
+        caches = sorted({labels[0] for labels in cache_lookups.values})
+    for cache in caches:
+        hits = cache_lookups.get(cache, "hit")
+        total = hits + cache_lookups.get(cache, "miss")
+        lines.append("org_roam_server_cache_hit_ratio%s %s" % (
+            format_labels(("cache",), (cache,)),
+            format_value(hits / total if total else 0.0)))
+    return "\n".join(lines) + "\n"
+
+
+class SlowRequestProfiler:
+    # Profiles one request at a time, keeping the report only when
+    # the request took longer than threshold seconds
+    def __init__(self, threshold, mode):
+        self.threshold = threshold
+        self.mode = mode
+        self.busy = threading.Lock()
+        # (time, description, duration, report), newest last
+        self.samples = deque(maxlen=MAX_PROFILES)
+        self.lock = threading.Lock()
+        if mode == "tracemalloc":
+            tracemalloc.start()
+
+    @contextmanager
+    def sample(self, description):
+        if not self.busy.acquire(blocking=False):
+            # Some other request is being profiled
+            yield
+            return
+        try:
+            started = time.perf_counter()
+            profile = snapshot = None
+            if self.mode == "cprofile":
+                profile = cProfile.Profile()
+                profile.enable()
+            else:
+                snapshot = tracemalloc.take_snapshot()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                duration = time.perf_counter() - started
+                if duration >= self.threshold:
+                    self.store(description, duration, profile, snapshot)
+        finally:
+            self.busy.release()
+
+    def store(self, description, duration, profile, snapshot):
+        output = io.StringIO()
+        if profile is not None:
+            stats = pstats.Stats(profile, stream=output)
+            stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+        else:
+            differences = tracemalloc.take_snapshot().compare_to(
+                snapshot, "lineno")
+            for difference in differences[:PROFILE_LINES]:
+                output.write(str(difference) + "\n")
+        with self.lock:
+            self.samples.append(
+                (time.time(), description, duration, output.getvalue()))
+
+    def report(self):
+        with self.lock:
+            samples = list(self.samples)
+        parts = []
+        for stamp, description, duration, output in reversed(samples):
+            parts.append("%s %s %.1f ms\n\n%s" % (
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamp)),
+                description, duration * 1000, output))
+        return "\n\n".join(parts) or "No slow requests sampled yet.\n"
@@ -38,6 +38,8 @@
 
 
 (require 'f)
+(require 'url)
+(require 'json)
 (require 'org-roam)
 
 ;;; Code:
@@ -100,20 +102,74 @@ in *org-roam-server-light-output-buffer* buffer."
   :group 'org-roam-server-light
   :type 'boolean)
 
+(defcustom org-roam-server-light-port 8080
+  "Port the python server listens on."
+  :group 'org-roam-server-light
+  :type 'integer)
+
 (defvar org-roam-server-light-last-roam-buffer ""
   "Variable storing name of the last org-roam buffer.")
 
+(defvar org-roam-server-light-settings
+  '(org-roam-server-light-network-vis-options
+    org-roam-server-light-default-include-filters
+    org-roam-server-light-default-exclude-filters
+    org-roam-server-light-style
+    org-roam-db-location
+    org-roam-directory)
+  "Variables handed to the server.
+
+They are written to `org-roam-server-light-tmp-dir' when the server
+starts and pushed to it whenever they are set later.")
+
+(defvar org-roam-server-light--token nil
+  "Token the server started by Emacs accepts pushes with.")
+
+(defun org-roam-server-light--make-token ()
+  "Return a new random token."
+  (secure-hash 'sha256 (format "%s %s %s %s"
+                               (random t) (current-time) (emacs-pid) (random))))
+
+(defun org-roam-server-light-push (settings)
+  "Send SETTINGS to the running server, which applies them right away.
+
+SETTINGS is an alist of variable names and their string values."
+  (when org-roam-server-light--token
+    (let ((url-request-method "POST")
+          (url-request-extra-headers
+           `(("Content-Type" . "application/json")
+             ("Authorization" . ,(concat "Bearer " org-roam-server-light--token))))
+          (url-request-data (encode-coding-string (json-encode settings) 'utf-8)))
+      (ignore-errors
+        (url-retrieve (format "http://127.0.0.1:%d/push" org-roam-server-light-port)
+                      (lambda (_status) (kill-buffer (current-buffer)))
+                      nil t t)))))
+
+(defun org-roam-server-light-push-settings ()
+  "Send current values of `org-roam-server-light-settings' to the server."
+  (interactive)
+  (org-roam-server-light-push
+   (mapcar (lambda (symbol) (cons (symbol-name symbol) (symbol-value symbol)))
+           org-roam-server-light-settings)))
+
+(defun org-roam-server-light--setting-changed (symbol newval operation where)
+  "Push NEWVAL of SYMBOL to the server when OPERATION sets it.
+
+Buffer-local values, like those of `.dir-locals.el' for a second
+roam directory, are not pushed, as WHERE is their buffer."
+  (when (and (eq operation 'set) (null where) (stringp newval))
+    (org-roam-server-light-push (list (cons (symbol-name symbol) newval)))))
+
 (defun org-roam-server-light-update-last-buffer ()
   "Update `org-roam-server-light-last-roam-buffer'."
   (let ((buf (or (buffer-base-buffer (current-buffer)) (current-buffer))))
     (when (org-roam--org-roam-file-p
            (buffer-file-name buf))
-      (setq org-roam-server-light-last-roam-buffer
-            (car (last (split-string (org-roam--path-to-slug (buffer-name buf)) "/"))))
-      (f-write-text
-       org-roam-server-light-last-roam-buffer
-       'utf-8
-       (concat org-roam-server-light-tmp-dir "org-roam-server-light-last-roam-buffer")))))
+      (let ((slug (car (last (split-string (org-roam--path-to-slug (buffer-name buf)) "/")))))
+        (unless (equal slug org-roam-server-light-last-roam-buffer)
+          (setq org-roam-server-light-last-roam-buffer slug)
+          (org-roam-server-light-push
+           `(("org-roam-server-light-last-roam-buffer" . ,slug))))))))
 
 (defun org-roam-server-light-find-file-hook-function ()
   "If the current visited file is an `org-roam` file, update the current buffer."
@@ -132,6 +188,9 @@ in *org-roam-server-light-output-buffer* buffer."
         (progn
           (when (get-process title)
             (delete-process title))
+          (setq org-roam-server-light--token nil)
+          (dolist (symbol org-roam-server-light-settings)
+            (remove-variable-watcher symbol #'org-roam-server-light--setting-changed))
           (remove-hook 'find-file-hook #'org-roam-server-light-find-file-hook-function nil)
           (dolist (buf (org-roam--get-roam-buffers))
             (with-current-buffer buf
@@ -140,28 +199,24 @@ in *org-roam-server-light-output-buffer* buffer."
         (add-hook 'find-file-hook #'org-roam-server-light-find-file-hook-function nil nil)
         (unless (file-exists-p org-roam-server-light-tmp-dir)
           (make-directory org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-server-light-network-vis-options
-                      'utf-8
-                      (expand-file-name "org-roam-server-light-network-vis-options" org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-server-light-default-include-filters
-                      'utf-8
-                      (expand-file-name "org-roam-server-light-default-include-filters" org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-server-light-default-exclude-filters
-                      'utf-8
-                      (expand-file-name "org-roam-server-light-default-exclude-filters" org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-server-light-style
-                      'utf-8
-                      (expand-file-name "org-roam-server-light-style" org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-db-location
-                      'utf-8
-                      (expand-file-name "org-roam-db-location" org-roam-server-light-tmp-dir))
-        (f-write-text org-roam-directory
-                      'utf-8
-                      (expand-file-name "org-roam-directory" org-roam-server-light-tmp-dir))
+        ;; Files are only read at startup, later changes are pushed
+        (dolist (symbol (cons 'org-roam-server-light-last-roam-buffer
+                              org-roam-server-light-settings))
+          (f-write-text (symbol-value symbol)
+                        'utf-8
+                        (expand-file-name (symbol-name symbol) org-roam-server-light-tmp-dir)))
+        (dolist (symbol org-roam-server-light-settings)
+          (add-variable-watcher symbol #'org-roam-server-light--setting-changed))
+        (setq org-roam-server-light--token (org-roam-server-light--make-token))
 
         (let ((default-directory (or org-roam-server-light-dir
                                      (file-name-directory (symbol-file #'org-roam-server-light-mode))))
-              (exec (concat "python main.py" (when org-roam-server-light-debug " -d"))))
+              (process-environment (cons (concat "ORG_ROAM_SERVER_LIGHT_TOKEN="
+                                                 org-roam-server-light--token)
+                                         process-environment))
+              (exec (concat "python main.py"
+                            (format " -p %d" org-roam-server-light-port)
+                            (when org-roam-server-light-debug " -d"))))
           (if (and (file-writable-p default-directory)
                    (file-readable-p (expand-file-name "main.py" default-directory)))
               (start-process-shell-command "org-roam-server-light" "*org-roam-server-light-output-buffer*" exec)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+import re
+import textwrap
+from html import escape
+
+# Export of the org syntax notes mostly use, done in process instead of
+# running pandoc: headings, paragraphs, lists, links, emphasis, src,
+# example and quote blocks. Anything else raises Unsupported, so the caller can
+# export the file with pandoc rather than show it wrong.
+
+# Keywords which don't show up in the exported body
+IGNORED_KEYWORDS = {"title", "subtitle", "author", "date", "email",
+                    "created", "last_modified", "startup", "filetags",
+                    "category", "language", "description", "keywords",
+                    "roam_alias", "roam_tags", "roam_key"}
+
+HEADING = re.compile(r"^(\*+)\s+(.*?)\s*$")
+HEADING_TODO = re.compile(r"^(TODO|DONE)(?:\s+(.*))?$")
+# Headings with tags, priorities or COMMENT keyword
+HEADING_UNSUPPORTED = re.compile(r"\s:[\w@#%:]+:$|^\[#\w\]|^COMMENT\b")
+ITEM = re.compile(r"^(\s*)([-+*]|\d+[.)])(?:\s+(.*?))?\s*$")
+DESCRIPTION = re.compile(r"^(.*?)\s+::(?:\s+(.*))?$")
+CHECKBOX = re.compile(r"^\[[ Xx-]\](?:\s|$)")
+BLOCK = re.compile(r"^\s*#\+begin_(\w+)(?:\s+(\S+))?", re.I)
+KEYWORD = re.compile(r"^\s*#\+(\w+):")
+DRAWER = re.compile(r"^\s*:(\w+):\s*$")
+RULE = re.compile(r"^\s*-{5,}\s*$")
+COMMENT = re.compile(r"^\s*#(?:\s|$)")
+# Lines of keywords without value, tables, fixed width areas,
+# LaTeX environments, footnotes and planning of entries
+LINE_UNSUPPORTED = re.compile(
+    r"^\s*(?:#\+|\||:(?:\s|$)|\\begin\{|\[fn:|(?:SCHEDULED|DEADLINE|CLOSED):)")
+# Lines of src blocks starting with * or #+ are escaped with a comma
+BLOCK_ESCAPE = re.compile(r"^(\s*),(\*|#\+)", re.M)
+
+# Links, verbatim and code, and plain URLs, which are exported as they
+# are, without looking for emphasis inside
+INLINE = re.compile(
+    r"\[\[([^\[\]]+)\](?:\[([^\[\]]+)\])?\]"
+    r"|(?<![^\s({'\"-])([=~])(?=\S)(.+?)(?<=\S)\3(?=[\s.,:;!?'\")}\[-]|$)"
+    r"|\b(?:https?|ftp)://[^\s<>\[\]\"']*[^\s<>\[\]\"'.,:;!?)]", re.S)
+EMPHASIS = re.compile(
+    r"(?<![^\s({'\"-])([*/_+])(?=\S)(.+?)(?<=\S)\1(?=[\s.,:;!?'\")}\[-]|$)",
+    re.S)
+EMPHASIS_TAGS = {
+    "*": ("<strong>", "</strong>"),
+    "/": ("<em>", "</em>"),
+    "_": ("<u>", "</u>"),
+    "+": ("<del>", "</del>"),
+}
+# Entities, line breaks, footnotes, links not matched above, inline
+# HTML, macros, targets, LaTeX math, subscripts and superscripts
+INLINE_UNSUPPORTED = re.compile(
+    r"\\|\[fn:|\[\[|\]\]|@@|\{\{\{|<<|\$[^\s$][^$]*\$"
+    r"|[^\s\0][_^](?:\{|\w)")
+IMAGE = re.compile(r"\.(?:png|jpe?g|gif|svg|webp)$", re.I)
+PLACEHOLDER = re.compile(r"\0(\d+)\0")
+SMART_PUNCTUATION = [
+    (re.compile(r"---"), "\u2014"),
+    (re.compile(r"--"), "\u2013"),
+    (re.compile(r"\.\.\."), "\u2026"),
+    (re.compile(r"(?<![^\s(\[{])\""), "\u201c"),
+    (re.compile(r"\""), "\u201d"),
+    (re.compile(r"(?<![^\s(\[{])'"), "\u2018"),
+    (re.compile(r"'"), "\u2019"),
+]
+ITEM_START = {"ul": "<li>", "ol": "<li>"}
+ITEM_END = {"ul": "</li>\n", "ol": "</li>\n", "dl": "</dd>\n"}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def smarten(text):
+    for pattern, replacement in SMART_PUNCTUATION:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def render_text(text):
+    # Escaped text with emphasis, literal parts are still placeholders
+    parts = []
+    position = 0
+    for match in EMPHASIS.finditer(text):
+        parts.append(smarten(escape(text[position:match.start()], False)))
+        start, end = EMPHASIS_TAGS[match.group(1)]
+        parts.append(start + render_text(match.group(2)) + end)
+        position = match.end()
+    parts.append(smarten(escape(text[position:], False)))
+    return "".join(parts)
+
+
+def render_link(target, description):
+    if "::" in target:
+        raise Unsupported("search option in link %s" % target)
+    if target.startswith("id:"):
+        # Finding the file of the heading needs the DB
+        raise Unsupported("id link %s" % target)
+    path = target[len("file:"):] if target.startswith("file:") else target
+    if description is None and IMAGE.search(path):
+        raise Unsupported("inline image %s" % path)
+    # Other notes are exported next to this one
+    href = path[:-len(".org")] + ".html" if path.endswith(".org") else path
+    text = render_inline(description) if description else escape(path)
+    return '<a href="%s">%s</a>' % (escape(href), text)
+
+
+def render_literal(match):
+    if match.group(1) is not None:
+        return render_link(match.group(1), match.group(2))
+    if match.group(3) is not None:
+        return "<code>%s</code>" % escape(match.group(4), False)
+    return '<a href="%s" class="uri">%s</a>' % (
+        escape(match.group(0)), escape(match.group(0), False))
+
+
+def render_inline(text):
+    if "\0" in text:
+        raise Unsupported("NUL character")
+    literals = []
+
+    def keep(match):
+        literals.append(render_literal(match))
+        return "\0%d\0" % (len(literals) - 1)
+
+    text = INLINE.sub(keep, text)
+    unsupported = INLINE_UNSUPPORTED.search(text)
+    if unsupported:
+        raise Unsupported("markup %r" % unsupported.group(0))
+    return PLACEHOLDER.sub(lambda match: literals[int(match.group(1))],
+                           render_text(text))
+
+
+class Renderer:
+    # Turns lines of org into HTML as they come, pieces of it
+    # are collected in out
+    def __init__(self):
+        self.out = []
+        self.paragraph = []
+        # [indent, tag, lines of current item not written yet or None]
+        # for every list open, innermost last
+        self.lists = []
+        # Blank line seen inside a list
+        self.blank = False
+        # (pattern of the end line, name, opening tag) inside a block
+        self.block = None
+        self.block_lines = []
+        self.drawer = False
+
+    def feed(self, line):
+        line = line.rstrip("\r\n")
+        if self.block is not None:
+            self.feed_block(line)
+            return
+        if self.drawer:
+            if line.strip().upper() == ":END:":
+                self.drawer = False
+            return
+        if not line.strip():
+            self.end_paragraph()
+            self.blank = bool(self.lists)
+            return
+        line = line.expandtabs(8)
+        indent = len(line) - len(line.lstrip())
+        heading = HEADING.match(line)
+        item = None if heading else ITEM.match(line)
+        if self.lists:
+            if self.blank:
+                # Items separated by blank lines are exported with
+                # paragraphs inside, which isn't done here
+                if indent > self.lists[0][0] or (
+                        item and indent == self.lists[0][0]):
+                    raise Unsupported("list with blank lines")
+                self.close_lists()
+            elif item:
+                self.add_item(len(item.group(1)), item.group(2),
+                              item.group(3) or "")
+                return
+            elif indent > self.lists[0][0]:
+                self.continue_item(indent, line.strip())
+                return
+            else:
+                self.close_lists()
+        self.feed_line(line, heading, item)
+
+    def feed_line(self, line, heading, item):
+        if heading:
+            self.end_paragraph()
+            self.add_heading(len(heading.group(1)), heading.group(2))
+        elif item:
+            self.end_paragraph()
+            self.add_item(len(item.group(1)), item.group(2),
+                          item.group(3) or "")
+        elif BLOCK.match(line):
+            self.end_paragraph()
+            self.start_block(*BLOCK.match(line).groups())
+        elif KEYWORD.match(line):
+            name = KEYWORD.match(line).group(1)
+            if name.lower() not in IGNORED_KEYWORDS:
+                raise Unsupported("keyword %s" % name)
+            self.end_paragraph()
+        elif COMMENT.match(line):
+            self.end_paragraph()
+        elif DRAWER.match(line):
+            if DRAWER.match(line).group(1).upper() != "PROPERTIES":
+                raise Unsupported("drawer %s" % line.strip())
+            self.end_paragraph()
+            self.drawer = True
+        elif RULE.match(line):
+            self.end_paragraph()
+            self.out.append("<hr />\n")
+        elif LINE_UNSUPPORTED.match(line):
+            raise Unsupported("line %r" % line)
+        else:
+            self.paragraph.append(line.strip())
+
+    def finish(self):
+        if self.block is not None or self.drawer:
+            raise Unsupported("block without end")
+        self.end_paragraph()
+        self.close_lists()
+
+    def end_paragraph(self):
+        if self.paragraph:
+            self.out.append(
+                "<p>%s</p>\n" % render_inline("\n".join(self.paragraph)))
+            self.paragraph = []
+
+    def add_heading(self, level, text):
+        if HEADING_UNSUPPORTED.search(text):
+            raise Unsupported("heading %r" % text)
+        keyword = ""
+        todo = HEADING_TODO.match(text)
+        if todo:
+            keyword = '<span class="todo %s">%s</span> ' % (
+                todo.group(1), todo.group(1))
+            text = todo.group(2) or ""
+        level = min(level, 6)
+        self.out.append("<h%d>%s%s</h%d>\n" % (
+            level, keyword, render_inline(text), level))
+
+    def start_block(self, name, language):
+        name = name.lower()
+        if name == "src":
+            opening = ('<pre class="sourceCode %s"><code>' % escape(language)
+                       if language else "<pre><code>")
+        elif name == "example":
+            opening = '<pre class="example"><code>'
+        elif name == "quote":
+            opening = "<blockquote>\n"
+        else:
+            raise Unsupported("%s block" % name)
+        self.block = (re.compile(r"^\s*#\+end_%s\s*$" % name, re.I), name,
+                      opening)
+        self.block_lines = []
+
+    def feed_block(self, line):
+        end, name, opening = self.block
+        if not end.match(line):
+            self.block_lines.append(line)
+            return
+        if name == "quote":
+            # Contents of quotes are org themselves
+            self.out.append("%s%s</blockquote>\n" % (
+                opening, "".join(render(self.block_lines))))
+        else:
+            code = textwrap.dedent("\n".join(self.block_lines))
+            code = BLOCK_ESCAPE.sub(r"\1\2", code)
+            self.out.append("%s%s</code></pre>\n" % (
+                opening, escape(code, False)))
+        self.block = None
+        self.block_lines = []
+
+    def add_item(self, indent, bullet, text):
+        if CHECKBOX.match(text):
+            raise Unsupported("checkbox")
+        tag = "ul" if bullet in "-+*" else "ol"
+        description = DESCRIPTION.match(text) if tag == "ul" else None
+        if description:
+            tag = "dl"
+            text = description.group(2) or ""
+        while self.lists and self.lists[-1][0] > indent:
+            self.close_list()
+        if (self.lists and self.lists[-1][0] == indent
+                and self.lists[-1][1] != tag):
+            self.close_list()
+        if self.lists and self.lists[-1][0] == indent:
+            self.close_item()
+        else:
+            if self.lists:
+                # Nested list goes after the text of the enclosing item
+                self.flush_item()
+                self.out.append("\n")
+            self.out.append("<%s>\n" % tag)
+            self.lists.append([indent, tag, None])
+        if description:
+            self.out.append("<dt>%s</dt>\n<dd>" % render_inline(
+                description.group(1).strip()))
+        else:
+            self.out.append(ITEM_START[tag])
+        self.lists[-1][2] = [text]
+
+    def continue_item(self, indent, text):
+        if (BLOCK.match(text) or KEYWORD.match(text) or COMMENT.match(text)
+                or DRAWER.match(text) or RULE.match(text)
+                or LINE_UNSUPPORTED.match(text)):
+            raise Unsupported("block inside list")
+        # Belongs to the innermost item whose bullet is less indented
+        while self.lists[-1][0] >= indent:
+            self.close_list()
+        if self.lists[-1][2] is None:
+            raise Unsupported("text after nested list")
+        self.lists[-1][2].append(text)
+
+    def flush_item(self):
+        current = self.lists[-1]
+        if current[2] is not None:
+            self.out.append(render_inline("\n".join(current[2])))
+            current[2] = None
+
+    def close_item(self):
+        self.flush_item()
+        self.out.append(ITEM_END[self.lists[-1][1]])
+
+    def close_list(self):
+        self.close_item()
+        self.out.append("</%s>" % self.lists.pop()[1])
+        if not self.lists:
+            self.out.append("\n")
+
+    def close_lists(self):
+        while self.lists:
+            self.close_list()
+        self.blank = False
+
+
+def render(lines):
+    # HTML of the org document in lines, produced piece by piece.
+    # Raises Unsupported as soon as something only pandoc exports shows up.
+    renderer = Renderer()
+    for line in lines:
+        renderer.feed(line)
+        if renderer.out:
+            yield "".join(renderer.out)
+            renderer.out = []
+    renderer.finish()
+    yield "".join(renderer.out)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Values of a column serialized at once when streaming
+CHUNK_ITEMS = 1024
+COMPACT_SEPARATORS = (",", ":")
+
+CONTENT_TYPES = {
+    "columnar": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def supported_formats():
+    if msgpack is not None:
+        return ["json", "columnar", "msgpack"]
+    return ["json", "columnar"]
+
+
+def common_root(nodes):
+    directories = {os.path.dirname(node.path) for node in nodes}
+    if not directories:
+        return ""
+    try:
+        root = os.path.commonpath(list(directories))
+    except ValueError:
+        return ""
+    return root.rstrip(os.sep) + os.sep
+
+
+def columnar_snapshot(graph, version):
+    # Node fields as parallel arrays, tags interned and edges pointing
+    # to node indices. id, label and url are derived by the client
+    # from path and title, so they are left out.
+    nodes = list(graph.nodes.values())
+    index = {node.id: i for i, node in enumerate(nodes)}
+    root = common_root(nodes)
+    tags = {}
+    node_tags = []
+    for node in nodes:
+        if node.tags is None:
+            node_tags.append(None)
+        else:
+            node_tags.append([tags.setdefault(tag, len(tags))
+                              for tag in node.tags])
+    edges = [(index[source], index[dest]) for source, dest in graph.edges
+             if source in index and dest in index]
+
+    columns = [
+        ("type", "snapshot"),
+        ("format", "columnar"),
+        ("version", version),
+        ("root", root),
+        ("tags", list(tags)),
+        ("title", [node.title for node in nodes]),
+        ("path", [node.path[len(root):] for node in nodes]),
+        ("nodeTags", node_tags),
+    ]
+    if graph.positions:
+        positions = [graph.positions.get(node.id) for node in nodes]
+        columns.append(("x", [p[0] if p else None for p in positions]))
+        columns.append(("y", [p[1] if p else None for p in positions]))
+    columns.append(("from", [edge[0] for edge in edges]))
+    columns.append(("to", [edge[1] for edge in edges]))
+    return columns
+
+
+def json_chunks(columns):
+    separator = "{"
+    for key, value in columns:
+        yield separator + json.dumps(key) + ":"
+        separator = ","
+        if not isinstance(value, list):
+            yield json.dumps(value, ensure_ascii=False,
+                             separators=COMPACT_SEPARATORS)
+            continue
+        yield "["
+        for start in range(0, len(value), CHUNK_ITEMS):
+            part = json.dumps(value[start:start + CHUNK_ITEMS],
+                              ensure_ascii=False,
+                              separators=COMPACT_SEPARATORS)[1:-1]
+            yield part if start == 0 else "," + part
+        yield "]"
+    yield "}"
+
+
+def msgpack_chunks(columns):
+    packer = msgpack.Packer(use_bin_type=True)
+    yield packer.pack_map_header(len(columns))
+    for key, value in columns:
+        yield packer.pack(key)
+        if not isinstance(value, list):
+            yield packer.pack(value)
+            continue
+        yield packer.pack_array_header(len(value))
+        for start in range(0, len(value), CHUNK_ITEMS):
+            yield b"".join(packer.pack(item)
+                           for item in value[start:start + CHUNK_ITEMS])
+
+
+def encode_chunks(columns, data_format):
+    if data_format == "msgpack":
+        return msgpack_chunks(columns)
+    return json_chunks(columns)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import os
+import html
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orgrender
+from admission import SingleFlight
+from metrics import pandoc_duration, preview_renders, cache_lookups
+
+# Rendered previews kept in memory and in the on-disk store
+MAX_MEMORY_ENTRIES = 256
+MAX_DISK_ENTRIES = 4096
+# How many pandoc processes may run at once
+MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Renders in advance run on their own, so they never delay a request
+PRERENDER_WORKERS = 1
+
+
+class PreviewError(Exception):
+    pass
+
+
+def render_with_pandoc(path):
+    try:
+        with pandoc_duration.time():
+            result = subprocess.run(
+                ["pandoc", path, "-f", "org", "-t", "html"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise PreviewError("pandoc failed to export %s: %s" % (path, e))
+    return result.stdout.decode("utf8")
+
+
+def fix_href(body):
+    return body.replace('.org">', '.html">')
+
+
+def render_body(path):
+    # Most notes are exported in process, pandoc is started only
+    # for files using something the renderer doesn't know
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            body = "".join(orgrender.render(f))
+    except (orgrender.Unsupported, UnicodeDecodeError):
+        preview_renders.inc("pandoc")
+        return fix_href(render_with_pandoc(path))
+    except OSError as e:
+        raise PreviewError("failed to read %s: %s" % (path, e))
+    preview_renders.inc("python")
+    return body
+
+
+def wrap_preview(title, body):
+    return (
+        """
+        <!DOCTYPE html>
+        <html lang="en">
+        <head>
+        <meta charset="utf-8">
+        <style>
+        a {color: #0062CC;}
+        * {font-size: 1.1rem;}
+        body {
+        padding: 0.5rem 1rem;
+        }
+        </style>
+        </head>
+        <body>
+        <br>
+        """
+        + "<h1>"
+        + html.escape(title)
+        + "</h1>"
+        + body
+        + """
+        </body>
+        </html>
+        """
+    )
+
+
+class PreviewCache:
+    def __init__(self, cache_dir, graph_store):
+        self.cache_dir = cache_dir
+        self.graph_store = graph_store
+        # key -> rendered html, least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.prerender_pool = ThreadPoolExecutor(
+            max_workers=PRERENDER_WORKERS)
+        # Requests for a preview being rendered wait for that render
+        self.renders = SingleFlight("preview")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path):
+        stat = os.stat(path)
+        title = self.graph_store.get().title(path)
+        key = "\0".join([path, str(stat.st_mtime_ns), str(stat.st_size), title])
+        return hashlib.sha1(key.encode("utf8")).hexdigest(), title
+
+    def get(self, path):
+        key, title = self.key(path)
+        preview = self.lookup(key)
+        if preview is None:
+            cache_lookups.inc("preview", "miss")
+            preview = self.renders.do(key, self.render_and_store,
+                                      key, path, title)
+        else:
+            cache_lookups.inc("preview", "hit")
+        return preview
+
+    def prerender(self, paths):
+        for path in paths:
+            self.prerender_pool.submit(self.prerender_one, path)
+
+    def prerender_one(self, path):
+        try:
+            key, title = self.key(path)
+            if self.lookup(key) is None:
+                self.renders.do(key, self.store_render, key, path, title)
+        except (OSError, PreviewError):
+            pass
+
+    def render_and_store(self, key, path, title):
+        preview = self.pool.submit(self.render, path, title).result()
+        self.store(key, preview)
+        return preview
+
+    def store_render(self, key, path, title):
+        # On the prerender thread, not taking a slot of requests
+        preview = self.render(path, title)
+        self.store(key, preview)
+        return preview
+
+    def render(self, path, title):
+        return wrap_preview(title, render_body(path))
+
+    def lookup(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        try:
+            with open(self.disk_path(key), "r", encoding="utf8") as f:
+                preview = f.read()
+            # Keeps recently used entries from being pruned
+            os.utime(self.disk_path(key))
+        except OSError:
+            return None
+        self.remember(key, preview)
+        return preview
+
+    def store(self, key, preview):
+        self.remember(key, preview)
+        tmp_path = self.disk_path(key) + ".tmp%d" % threading.get_ident()
+        try:
+            with open(tmp_path, "w", encoding="utf8") as f:
+                f.write(preview)
+            os.replace(tmp_path, self.disk_path(key))
+            self.prune_disk()
+        except OSError:
+            pass
+
+    def remember(self, key, preview):
+        with self.lock:
+            self.entries[key] = preview
+            self.entries.move_to_end(key)
+            while len(self.entries) > MAX_MEMORY_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def prune_disk(self):
+        entries = [entry for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith(".html")]
+        if len(entries) <= MAX_DISK_ENTRIES:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - MAX_DISK_ENTRIES]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def disk_path(self, key):
+        return os.path.join(self.cache_dir, key + ".html")
@@ -2,7 +2,11 @@ from response.requestHandler import RequestHandler
 
 
 class BadRequestHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, status=404, headers=None):
         super().__init__()
         self.contentType = "text/plain"
-        self.setStatus(404)
+        self.headers = headers or {}
+        self.setStatus(status)
+
+    def getHeaders(self):
+        return self.headers
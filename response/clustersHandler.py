@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import json
+from response.requestHandler import RequestHandler
+
+# How long a request waits for clusters of a freshly changed graph
+CLUSTERS_TIMEOUT = 30
+# Elements shown when no level is asked for
+DEFAULT_MAX_NODES = 300
+
+
+class ClustersHandler(RequestHandler):
+    def __init__(self, graph_clusters, query):
+        super().__init__()
+        self.contentType = "application/json"
+
+        max_nodes = max(query.get_int("max-nodes", DEFAULT_MAX_NODES), 1)
+        level = query.get_int("level")
+
+        result = graph_clusters.get(CLUSTERS_TIMEOUT)
+        if result is None:
+            self.contents = ""
+            self.setStatus(503)
+            return
+        graph, hierarchy = result
+
+        if level is None:
+            level = hierarchy.detail_level(max_nodes)
+        level = min(max(level, 0), hierarchy.levels())
+        # Ids of clusters from other versions are left collapsed
+        expanded = set(filter(None, map(hierarchy.parse_cluster_id,
+                                        query.get_list("expand"))))
+        self.contents = json.dumps(hierarchy.to_dict(
+            graph, level, expanded,
+            graph_clusters.graph_store.format_version(graph.version)),
+            ensure_ascii=False)
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
-import os.path
 from response.requestHandler import RequestHandler
 from variables import org_roam_server_light_tmp_dir
+from response.networkVisHandler import network_vis_options_file
+from response.serverCSSHandler import server_css_file
+from events import (HEARTBEAT_INTERVAL, KEEP_ALIVE, format_event,
+                    format_named_event)
 
 last_roam_buffer_file = (
     org_roam_server_light_tmp_dir
@@ -10,28 +13,57 @@ last_roam_buffer_file = (
     "org-roam-server-light-last-roam-buffer"
 )
 
-previous_mtime = 1
+# Settings sent to connected clients as named events when they change
+SETTINGS_EVENTS = {
+    network_vis_options_file: "network-vis-options",
+    server_css_file: "server-css",
+}
 
 
 class CurrentBufferHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, watcher, last_event_id=None):
         super().__init__()
-        global last_roam_buffer_file
-        global previous_mtime
 
+        self.watcher = watcher
         self.contentType = "text/event-stream"
-
-        if os.path.isfile(last_roam_buffer_file):
-            current_mtime = os.path.getmtime(last_roam_buffer_file)
-            if current_mtime == previous_mtime:
-                self.contents = ""
-            else:
-                last_roam_buffer = open(last_roam_buffer_file, "r").read()
-                self.contents = "data: " + last_roam_buffer + "\n\n"
-                previous_mtime = current_mtime
-        else:
-            self.contents = ""
+        # mtime of the last buffer file this client has seen
+        self.last_event_id = last_event_id
+        self.stamp, self.contents = self.next_event()
+        # Clients fetch settings when they load, later changes are pushed
+        self.settings = {path: watcher.stamp(path) for path in SETTINGS_EVENTS}
         self.setStatus(200)
 
     def getContents(self):
         return self.contents
+
+    def getStream(self):
+        return self.stream()
+
+    def stream(self):
+        if self.contents:
+            yield self.contents
+        stamps = dict(self.settings)
+        stamps[last_roam_buffer_file] = self.stamp
+        while True:
+            self.watcher.wait_any(stamps, HEARTBEAT_INTERVAL)
+            events = []
+            for path, name in SETTINGS_EVENTS.items():
+                stamp, contents = self.watcher.state(path)
+                if stamp != stamps[path]:
+                    stamps[path] = stamp
+                    events.append(format_named_event(name, contents or ""))
+            stamps[last_roam_buffer_file], event = self.next_event()
+            events.append(event)
+            yield "".join(events) or KEEP_ALIVE
+
+    def next_event(self):
+        global last_roam_buffer_file
+
+        stamp, last_roam_buffer = self.watcher.state(last_roam_buffer_file)
+        if stamp is None:
+            return stamp, ""
+        current_mtime = str(stamp[0])
+        if current_mtime == self.last_event_id:
+            return stamp, ""
+        self.last_event_id = current_mtime
+        return stamp, format_event(current_mtime, last_roam_buffer)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import os.path
 from response.requestHandler import RequestHandler
 from variables import org_roam_server_light_tmp_dir
 
@@ -19,20 +18,17 @@ default_exclude_filters_file = (
 
 
 class DefaultFiltersHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, watcher):
         super().__init__()
         global default_include_filters_file
         global default_exclude_filters_file
         self.contentType = "application/json"
 
-        if (os.path.isfile(default_include_filters_file)
-                and os.path.isfile(default_exclude_filters_file)):
-            default_include_filters = open(
-                default_include_filters_file, "r").read()
-
-            default_exclude_filters = open(
-                default_exclude_filters_file, "r").read()
+        default_include_filters = watcher.read(default_include_filters_file)
+        default_exclude_filters = watcher.read(default_exclude_filters_file)
 
+        if (default_include_filters is not None
+                and default_exclude_filters is not None):
             self.contents = "{\"include\": %s, \"exclude\": %s}" % (
                 default_include_filters, default_exclude_filters)
         else:
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+from response.requestHandler import RequestHandler
+
+# How long a request waits for statistics of a freshly changed graph
+STATS_TIMEOUT = 30
+
+
+class GraphStatsHandler(RequestHandler):
+    def __init__(self, graph_stats):
+        super().__init__()
+        self.contentType = "application/json"
+        self.etag = None
+
+        result = graph_stats.get(STATS_TIMEOUT)
+        if result is None:
+            self.contents = ""
+            self.setStatus(503)
+            return
+        self.contents, self.etag = result
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
+
+    def getETag(self):
+        return self.etag
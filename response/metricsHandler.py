@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import metrics
+from response.requestHandler import RequestHandler
+
+
+class MetricsHandler(RequestHandler):
+    def __init__(self):
+        super().__init__()
+        # Prometheus text exposition format
+        self.contentType = "text/plain; version=0.0.4; charset=utf-8"
+        self.contents = metrics.render()
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import os.path
 from response.requestHandler import RequestHandler
 from variables import org_roam_server_light_tmp_dir
 
@@ -13,14 +12,13 @@ network_vis_options_file = (
 
 
 class NetworkVisHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, watcher):
         super().__init__()
         global network_vis_options_file
         self.contentType = "application/json"
 
-        if os.path.isfile(network_vis_options_file) and os.path.getsize(network_vis_options_file) > 0:
-            network_vis_options = open(
-                network_vis_options_file, "r").read()
+        network_vis_options = watcher.read(network_vis_options_file)
+        if network_vis_options:
             self.contents = network_vis_options
         else:
             self.contents = "{}"
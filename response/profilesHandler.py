@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+from response.requestHandler import RequestHandler
+
+
+class ProfilesHandler(RequestHandler):
+    def __init__(self, profiler):
+        super().__init__()
+        self.contentType = "text/plain; charset=utf-8"
+        if profiler is None:
+            # Profiling wasn't enabled by --profile-slow
+            self.contents = ""
+            self.setStatus(404)
+            return
+        self.contents = profiler.report()
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
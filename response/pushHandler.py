@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import json
+from response.requestHandler import RequestHandler
+from settings import NAMES
+
+
+class PushHandler(RequestHandler):
+    def __init__(self, settings, authorization, body):
+        super().__init__()
+        self.contentType = "application/json"
+        self.contents = ""
+        self.headers = {}
+
+        if not settings.authorized(authorization):
+            self.headers["WWW-Authenticate"] = "Bearer"
+            self.setStatus(401)
+            return
+
+        try:
+            values = json.loads(body.decode("utf8"))
+        except ValueError as e:
+            print(e)
+            self.setStatus(400)
+            return
+        if (not isinstance(values, dict)
+                or any(name not in NAMES or not isinstance(value, str)
+                       for name, value in values.items())):
+            print("Unknown setting or value which isn't a string pushed")
+            self.setStatus(400)
+            return
+
+        settings.update(values)
+        self.contents = json.dumps({"applied": sorted(values)})
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
+
+    def getHeaders(self):
+        return self.headers
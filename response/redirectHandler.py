@@ -0,0 +1,12 @@
+from response.requestHandler import RequestHandler
+
+
+class RedirectHandler(RequestHandler):
+    def __init__(self, location):
+        super().__init__()
+        self.contentType = "text/plain"
+        self.location = location
+        self.setStatus(301)
+
+    def getHeaders(self):
+        return {"Location": self.location}
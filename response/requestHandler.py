@@ -11,6 +11,34 @@ class RequestHandler:
     def getContents(self):
         return self.contents.read()
 
+    def getStream(self):
+        # Handlers which can keep their connection open and push more data
+        # return an iterable of chunks, others are sent in one go.
+        return None
+
+    def getFile(self):
+        # (file descriptor, size) for contents sent straight from a file
+        return None
+
+    def getChunks(self):
+        # Iterable of pieces for contents too big to be joined in memory
+        return None
+
+    def getETag(self):
+        # None lets the response layer derive it from contents
+        return None
+
+    def getEncoded(self, encoding):
+        # Contents compressed in advance, if handler has them
+        return None
+
+    def getCacheControl(self):
+        return "no-cache"
+
+    def getHeaders(self):
+        # Extra response headers, sent with every status
+        return {}
+
     def read(self):
         return self.contents
 
@@ -1,101 +1,120 @@
 #!/usr/bin/env python3
 
-import os
 import json
-import sqlite3
-import urllib.parse
+import time
 from response.requestHandler import RequestHandler
-
-previous_db_mtime = 0
+from events import (HEARTBEAT_INTERVAL, KEEP_ALIVE, EVENT_INTERVAL,
+                    format_event)
+from payload import (CONTENT_TYPES, supported_formats, columnar_snapshot,
+                     encode_chunks)
 
 
 class RoamDataHandler(RequestHandler):
-    def __init__(self, roam_force, org_roam_db):
+    def __init__(self, roam_force, graph_store, events, documents,
+                 last_event_id=None, data_format="json"):
         super().__init__()
-        global previous_db_mtime
 
-        self.org_roam_db = org_roam_db
+        self.graph_store = graph_store
+        # SharedResults of events, streams at the same version get
+        # the same event, encoded once
+        self.events = events
+        # SharedResults of encoded snapshots, loads of the same version
+        # in the same format are a lookup
+        self.documents = documents
+        self.data_format = data_format
         self.contentType = "text/event-stream"
+        self.chunks = None
 
-        if len(roam_force) > 0:
-            is_force = roam_force[0]
-        else:
-            is_force = False
+        if data_format not in supported_formats():
+            self.contents = ""
+            self.setStatus(400)
+            return
 
-        current_db_mtime = os.path.getmtime(org_roam_db)
+        self.graph = graph_store.get()
+        client_version = graph_store.parse_version(last_event_id)
 
-        if current_db_mtime == previous_db_mtime and not is_force:
+        if roam_force and data_format != "json":
+            # Compact snapshot as a plain document
+            self.contentType = CONTENT_TYPES[data_format]
             self.contents = ""
+            self.chunks = documents.get(
+                (self.graph.version, data_format), self.document, self.graph)
+        elif roam_force:
+            self.contents = self.update_event(None, self.graph)
         else:
-            self.contents = "data: " + self.roam_server_data() + "\n\n"
-            previous_db_mtime = current_db_mtime
+            self.contents = self.update_event(client_version, self.graph)
 
         self.setStatus(200)
 
     def getContents(self):
         return self.contents
 
-    def roam_server_data(self):
-
-        graph = {"nodes": [], "edges": []}
-
-        conn = sqlite3.connect(self.org_roam_db)
-
-        c = conn.cursor()
-
-        node_query = """SELECT titles.file,title,tags
-                        FROM titles
-                        LEFT OUTER JOIN tags
-                        ON titles.file = tags.file"""
-        c.execute(node_query)
-        nodes = c.fetchall()
-
-        for node in nodes:
-            d = {}
-            path = node[0].strip('"')
-            d["id"] = os.path.splitext(os.path.basename(path))[0]
-            title = node[1].strip('"')
-            d["title"] = title
-            if node[2]:
-                tags = node[2].rstrip(')').lstrip('(').split()
-                sanitized_tags = []
-                for tag in tags:
-                    sanitized_tag = tag.strip('"')
-                    sanitized_tags.append(sanitized_tag)
-                d["tags"] = sanitized_tags
+    def getStream(self):
+        # Refused formats are answered with a plain error
+        if self.getStatus() != 200 or self.chunks is not None:
+            return None
+        return self.stream()
+
+    def getChunks(self):
+        return self.chunks
+
+    def getETag(self):
+        if self.chunks is None:
+            return None
+        return '"%s-%s"' % (self.version(self.graph), self.data_format)
+
+    def stream(self):
+        if self.contents:
+            yield self.contents
+        version = self.graph.version
+        while True:
+            graph = self.graph_store.wait(version, HEARTBEAT_INTERVAL)
+            if graph.version == version:
+                yield KEEP_ALIVE
             else:
-                d["tags"] = node[2]
-            d["label"] = title
-            d["url"] = "org-protocol://roam-file?file=" + \
-                urllib.parse.quote_plus(path)
-            d["path"] = path
-
-            can_append = True
-            for item in graph["nodes"]:
-                if item["id"] == d["id"]:
-                    can_append = False
-                    break
-                else:
-                    pass
-
-            if can_append:
-                graph["nodes"].append(d)
-
-        edges_query = """WITH selected AS (SELECT file FROM files)
-                        SELECT DISTINCT [source],[dest]
-                        FROM links
-                        WHERE [dest] IN selected AND [source] IN selected"""
-        c.execute(edges_query)
-        edges = c.fetchall()
-
-        for edge in edges:
-            d = {}
-            striped_from = edge[0].rstrip(')"').lstrip('("')
-            striped_to = edge[1].rstrip(')"').lstrip('("')
-            d["from"] = os.path.splitext(os.path.basename(striped_from))[0]
-            d["to"] = os.path.splitext(os.path.basename(striped_to))[0]
-            d["arrows"] = None
-            graph["edges"].append(d)
-
-        conn.close()
-        return json.dumps(graph, ensure_ascii=False)
+                yield self.update_event(version, graph)
+                version = graph.version
+                time.sleep(EVENT_INTERVAL)
+
+    def document(self, graph):
+        return tuple(encode_chunks(
+            columnar_snapshot(graph, self.version(graph)), self.data_format))
+
+    def update_event(self, client_version, graph):
+        return self.events.get(
+            (client_version, graph.version, self.data_format),
+            self.make_update_event, client_version, graph)
+
+    def make_update_event(self, client_version, graph):
+        # Diff against the version client already has, when possible
+        if client_version is None:
+            return self.event(graph, self.snapshot(graph))
+        if client_version == graph.version:
+            return ""
+        diff = self.graph_store.diff_since(client_version, graph)
+        if diff is None:
+            return self.event(graph, self.snapshot(graph))
+        diff["type"] = "diff"
+        diff["version"] = self.version(graph)
+        return self.event(graph, diff)
+
+    def event(self, graph, payload):
+        if isinstance(payload, list):
+            data = "".join(encode_chunks(payload, "columnar"))
+        else:
+            data = json.dumps(payload, ensure_ascii=False)
+        return format_event(self.version(graph), data)
+
+    def version(self, graph):
+        return self.graph_store.format_version(graph.version)
+
+    def snapshot(self, graph):
+        if self.data_format != "json":
+            # Event data is text, binary formats fall back to columnar JSON
+            return columnar_snapshot(graph, self.version(graph))
+        return {
+            "type": "snapshot",
+            "version": self.version(graph),
+            "nodes": [graph.node_dict(node) for node in graph.nodes.values()],
+            "edges": [edge.to_dict() for edge in graph.edges.values()],
+        }
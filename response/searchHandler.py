@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import json
+from response.requestHandler import RequestHandler
+from search import SearchError, DEFAULT_LIMIT, MAX_LIMIT
+
+
+class SearchHandler(RequestHandler):
+    def __init__(self, search_index, query):
+        super().__init__()
+        self.contentType = "application/json"
+
+        text = query.get("q", "")
+        limit = query.get_int("limit", DEFAULT_LIMIT)
+        offset = query.get_int("offset", 0)
+        limit = min(max(limit, 1), MAX_LIMIT)
+        offset = max(offset, 0)
+
+        try:
+            total, results = search_index.search(text, limit, offset)
+        except SearchError as e:
+            print(e)
+            self.contents = ""
+            self.setStatus(503)
+            return
+
+        self.contents = json.dumps({
+            "query": text,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "results": results,
+        }, ensure_ascii=False)
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
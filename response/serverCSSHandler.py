@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import os.path
 from response.requestHandler import RequestHandler
 from variables import org_roam_server_light_tmp_dir
 
@@ -13,16 +12,13 @@ server_css_file = (
 
 
 class ServerCSSHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, watcher):
         super().__init__()
         global server_css_file
         self.contentType = "text/css"
 
-        if (os.path.isfile(server_css_file)
-                and os.path.isfile(server_css_file)):
-            server_css = open(
-                server_css_file, "r").read()
-
+        server_css = watcher.read(server_css_file)
+        if server_css is not None:
             self.contents = server_css
         else:
             self.contents = ""
@@ -1,39 +1,35 @@
-import os
-
 from response.requestHandler import RequestHandler
 
 
 class StaticHandler(RequestHandler):
-    def __init__(self):
-        self.filetypes = {
-            ".js": "text/javascript",
-            ".css": "text/css",
-            ".jpg": "image/jpeg",
-            ".png": "image/png",
-            ".ico": "image/x-icon",
-            "notfound": "text/plain",
-        }
+    def __init__(self, assets):
+        super().__init__()
+        self.assets = assets
+        self.asset = None
 
     def find(self, file_path):
-        split_path = os.path.splitext(file_path)
-        extension = split_path[1]
-
-        try:
-            print("public{}".format(file_path))
-
-            if extension in (".jpg", ".jpeg", ".png", ".ico"):
-                self.contents = open("public{}".format(file_path), "rb")
-            else:
-                self.contents = open("public{}".format(
-                    file_path), "r", encoding="utf8")
-
-            self.setContentType(extension)
-            self.setStatus(200)
-            return True
-        except:
-            self.setContentType("notfound")
+        self.asset = self.assets.get(file_path)
+        if self.asset is None:
+            self.contentType = "text/plain"
             self.setStatus(404)
             return False
+        self.contentType = self.asset.content_type
+        self.setStatus(200)
+        return True
+
+    def getContents(self):
+        return self.asset.data
+
+    def getFile(self):
+        if self.asset.fd is None:
+            return None
+        return self.asset.fd, self.asset.size
+
+    def getETag(self):
+        return self.asset.etag
+
+    def getEncoded(self, encoding):
+        return self.asset.encoded.get(encoding)
 
-    def setContentType(self, ext):
-        self.contentType = self.filetypes[ext]
+    def getCacheControl(self):
+        return "public, max-age=3600"
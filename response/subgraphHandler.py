@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from response.requestHandler import RequestHandler
+
+# Deeper neighbourhoods cover most of a connected graph anyway
+MAX_DEPTH = 10
+
+
+class SubgraphHandler(RequestHandler):
+    def __init__(self, graph_store, org_roam_directory, query):
+        super().__init__()
+        self.graph_store = graph_store
+        self.org_roam_directory = org_roam_directory
+        self.contentType = "application/json"
+
+        depth = query.get_int("depth", 1, 0, MAX_DEPTH)
+        limit = query.get_int("limit")
+
+        graph = graph_store.get()
+        ids = self.select(graph,
+                          query.get_list("include-tag"),
+                          query.get_list("exclude-tag"),
+                          query.get("root"),
+                          depth,
+                          query.get("path"))
+        total = len(ids)
+        if limit is not None:
+            ids = ids[:max(limit, 0)]
+
+        self.contents = json.dumps({
+            "version": graph_store.format_version(graph.version),
+            "nodes": [graph.node_dict(graph.nodes[node_id]) for node_id in ids],
+            "edges": [edge.to_dict() for edge in graph.edges_between(ids)],
+            "total": total,
+            "truncated": len(ids) < total,
+        }, ensure_ascii=False)
+        self.setStatus(200)
+
+    def getContents(self):
+        return self.contents
+
+    def select(self, graph, include_tags, exclude_tags, root, depth, path):
+        # Start from the most selective index, then filter the rest
+        if root:
+            ids = graph.neighbourhood(root, depth)
+        elif path:
+            ids = graph.under_path(self.path_prefix(path))
+        elif include_tags:
+            ids = list(set.intersection(
+                *[graph.by_tag.get(tag, set()) for tag in include_tags]))
+        else:
+            ids = list(graph.nodes)
+
+        if root and path:
+            prefix = self.path_prefix(path)
+            ids = [node_id for node_id in ids
+                   if graph.nodes[node_id].path.startswith(prefix)]
+        if include_tags:
+            # Same semantics as include filters in the web app,
+            # node must have every included tag
+            for tag in include_tags:
+                tagged = graph.by_tag.get(tag, set())
+                ids = [node_id for node_id in ids if node_id in tagged]
+        for tag in exclude_tags:
+            tagged = graph.by_tag.get(tag, set())
+            ids = [node_id for node_id in ids if node_id not in tagged]
+
+        if not root:
+            # Most connected notes first when result gets capped
+            ids.sort(key=lambda node_id: (-graph.degree(node_id), node_id))
+        return ids
+
+    def path_prefix(self, path):
+        path = os.path.join(self.org_roam_directory, path)
+        if path.endswith(".org"):
+            return path
+        return path.rstrip(os.sep) + os.sep
@@ -2,16 +2,24 @@ from response.requestHandler import RequestHandler
 
 
 class TemplateHandler(RequestHandler):
-    def __init__(self):
+    def __init__(self, templates):
         super().__init__()
+        self.templates = templates
         self.contentType = "text/html"
 
     def find(self, routeData):
-        try:
-            template_file = open("templates/{}".format(routeData["template"]))
-            self.contents = template_file
-            self.setStatus(200)
-            return True
-        except:
+        self.template = self.templates.get("/" + routeData["template"])
+        if self.template is None:
             self.setStatus(404)
             return False
+        self.setStatus(200)
+        return True
+
+    def getContents(self):
+        return self.template.data
+
+    def getETag(self):
+        return self.template.etag
+
+    def getEncoded(self, encoding):
+        return self.template.encoded.get(encoding)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+from urllib.parse import parse_qs, urlparse
+
+READ_METHODS = ("GET", "HEAD")
+# Bodies of bigger requests are refused without being read
+MAX_BODY_SIZE = 1024 * 1024
+# Paths under /vault/NAME/ are served from vault NAME
+VAULT_PREFIX = "/vault/"
+
+
+class QueryError(Exception):
+    pass
+
+
+class Query:
+    # Typed access to parameters of a query string
+    def __init__(self, query_string):
+        self.values = parse_qs(query_string)
+
+    def get(self, name, default=None):
+        values = self.values.get(name)
+        return values[0] if values else default
+
+    def require(self, name):
+        value = self.get(name)
+        if value is None:
+            raise QueryError("%s is required" % name)
+        return value
+
+    def get_int(self, name, default=None, minimum=None, maximum=None):
+        value = self.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise QueryError("%s must be an integer, not %r" % (name, value))
+        if ((minimum is not None and value < minimum)
+                or (maximum is not None and value > maximum)):
+            raise QueryError("%s must be between %s and %s, not %d"
+                             % (name, minimum, maximum, value))
+        return value
+
+    def get_bool(self, name):
+        return self.get(name, "").lower() not in ("", "0", "false", "no")
+
+    def get_list(self, name):
+        return list(self.values.get(name, ()))
+
+
+class Request:
+    def __init__(self, method, target, headers, body=b""):
+        url = urlparse(target)
+        self.method = method
+        self.path = url.path
+        self.query = Query(url.query)
+        self.headers = headers
+        self.body = body
+        # Name from the path prefix or vault= parameter, None for default.
+        # Path of /vault/NAME without the trailing slash becomes empty.
+        self.vault_name = self.query.get("vault")
+        if self.path.startswith(VAULT_PREFIX):
+            self.vault_name, slash, rest = (
+                self.path[len(VAULT_PREFIX):].partition("/"))
+            self.path = slash + rest
+        # Vault the request is served from, set by the server
+        self.vault = None
+
+
+class Route:
+    __slots__ = ("key", "factory", "methods", "limit")
+
+    def __init__(self, key, factory, methods, limit=None):
+        # key is the path or extension the route was added for,
+        # factory takes a Request and returns a handler,
+        # limit is ConcurrencyLimit of requests to the route or None
+        self.key = key
+        self.factory = factory
+        self.methods = tuple(methods)
+        self.limit = limit
+
+
+class Router:
+    def __init__(self):
+        # url path -> Route
+        self.routes = {}
+        # extension -> Route of paths which aren't in routes
+        self.extensions = {}
+        self.default = None
+
+    def add(self, path, factory, methods=READ_METHODS, limit=None):
+        self.routes[path] = Route(path, factory, methods, limit)
+
+    def add_extension(self, extension, factory, methods=READ_METHODS,
+                      limit=None):
+        self.extensions[extension] = Route(extension, factory, methods,
+                                           limit)
+
+    def set_default(self, factory, methods=READ_METHODS):
+        self.default = Route("default", factory, methods)
+
+    def find(self, path):
+        # Route of path, None when nothing matches
+        route = self.routes.get(path)
+        if route is None:
+            route = self.extensions.get(os.path.splitext(path)[1],
+                                        self.default)
+        return route
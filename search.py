@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+from graph import path_to_id
+
+# Bumping it rebuilds sidecar DBs made by older versions from scratch
+SCHEMA_VERSION = 1
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Files indexed between commits, so searches see progress of a long scan
+BATCH_SIZE = 500
+# How long a search waits for changed files to be indexed
+INDEX_TIMEOUT = 5
+# bm25 weights of title, tags and body columns
+RANK = "bm25(notes, 10.0, 5.0, 1.0)"
+
+
+class SearchError(Exception):
+    pass
+
+
+def match_query(text):
+    # Every word must appear, the last one may be unfinished
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not words:
+        return None
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def read_body(path):
+    with open(path, "r", encoding="utf8", errors="replace") as f:
+        return f.read()
+
+
+class SearchIndex:
+    def __init__(self, path, graph_store):
+        self.path = str(path)
+        self.graph_store = graph_store
+        # Set whenever org-roam DB changes, which happens on every
+        # save of a note, even when the graph itself stays the same
+        self.stale = True
+        self.busy = False
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        try:
+            self.setup()
+            self.available = True
+        except sqlite3.Error as e:
+            print("Full-text search is not available:", e)
+            self.available = False
+            return
+        graph_store.database.subscribe(self.invalidate)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def setup(self):
+        conn = self.connect()
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS files")
+                conn.execute("DROP TABLE IF EXISTS notes")
+                conn.execute("""CREATE TABLE files (
+                                id INTEGER PRIMARY KEY,
+                                path TEXT UNIQUE,
+                                mtime INTEGER,
+                                size INTEGER,
+                                title TEXT,
+                                tags TEXT)""")
+                conn.execute("""CREATE VIRTUAL TABLE notes USING fts5(
+                                title, tags, body,
+                                tokenize = 'unicode61 remove_diacritics 2')""")
+                conn.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+            # Searches read while the indexer writes
+            conn.execute("PRAGMA journal_mode = WAL")
+        finally:
+            conn.close()
+
+    def invalidate(self):
+        with self.lock:
+            self.stale = True
+            self.changed.notify_all()
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.changed.wait_for(lambda: self.stale)
+                self.stale = False
+                self.busy = True
+            try:
+                self.update(self.graph_store.get())
+            except (sqlite3.Error, OSError) as e:
+                print("Indexing notes failed:", e)
+            with self.lock:
+                self.busy = False
+                self.changed.notify_all()
+
+    def update(self, graph):
+        # Only files whose mtime, size, title or tags changed
+        # since the last scan are read again
+        conn = self.connect()
+        try:
+            known = {row[0]: row[1:] for row in conn.execute(
+                "SELECT path, id, mtime, size, title, tags FROM files")}
+            indexed = 0
+            for path, node in graph.by_path.items():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                tags = "\n".join(node.tags or ())
+                signature = (stat.st_mtime_ns, stat.st_size, node.title, tags)
+                row = known.pop(path, None)
+                if row is not None and tuple(row[1:]) == signature:
+                    continue
+                body = read_body(path)
+                if row is None:
+                    file_id = conn.execute(
+                        "INSERT INTO files (path, mtime, size, title, tags) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (path,) + signature).lastrowid
+                else:
+                    file_id = row[0]
+                    conn.execute(
+                        "UPDATE files SET mtime = ?, size = ?, title = ?, "
+                        "tags = ? WHERE id = ?", signature + (file_id,))
+                    conn.execute("DELETE FROM notes WHERE rowid = ?", (file_id,))
+                conn.execute(
+                    "INSERT INTO notes (rowid, title, tags, body) "
+                    "VALUES (?, ?, ?, ?)", (file_id, node.title, tags, body))
+                indexed += 1
+                if indexed % BATCH_SIZE == 0:
+                    conn.commit()
+
+            # Files which are no longer notes
+            for path, row in known.items():
+                conn.execute("DELETE FROM notes WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM files WHERE id = ?", (row[0],))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def search(self, text, limit=DEFAULT_LIMIT, offset=0):
+        # (total number of matches, page of results best first)
+        if not self.available:
+            raise SearchError("full-text search is not available")
+        query = match_query(text)
+        if query is None:
+            return 0, []
+
+        graph = self.graph_store.get()
+        with self.lock:
+            self.changed.wait_for(
+                lambda: not self.stale and not self.busy, INDEX_TIMEOUT)
+
+        conn = self.connect()
+        try:
+            total = conn.execute(
+                "SELECT count(*) FROM notes WHERE notes MATCH ?",
+                (query,)).fetchone()[0]
+            rows = conn.execute(
+                """SELECT files.path, matches.title, matches.snippet,
+                          matches.score
+                   FROM (SELECT rowid, title,
+                                snippet(notes, 2, '', '', '...', 16) AS snippet,
+                                """ + RANK + """ AS score
+                         FROM notes WHERE notes MATCH ?
+                         ORDER BY score LIMIT ? OFFSET ?) AS matches
+                   JOIN files ON files.id = matches.rowid
+                   ORDER BY matches.score""",
+                (query, limit, offset)).fetchall()
+        except sqlite3.Error as e:
+            raise SearchError("search for %r failed: %s" % (text, e))
+        finally:
+            conn.close()
+
+        results = []
+        for path, title, snippet, score in rows:
+            node = graph.by_path.get(path)
+            results.append({
+                "id": path_to_id(path),
+                "title": title,
+                "tags": node.tags if node is not None else None,
+                "path": path,
+                "snippet": snippet,
+                # bm25 is negative, lower is better
+                "score": round(-score, 4),
+            })
+        return total, results
@@ -1,127 +1,485 @@
 import os
-import sqlite3
+import time
+import metrics
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import parse_qs, urlparse
 from routes.main import routes
+from router import Router, Request, QueryError, MAX_BODY_SIZE
 from response.staticHandler import StaticHandler
 from response.templateHandler import TemplateHandler
 from response.badRequestHandler import BadRequestHandler
 from response.roamDataHandler import RoamDataHandler
 from response.networkVisHandler import NetworkVisHandler
 from response.currentBufferHandler import CurrentBufferHandler
+from response.currentBufferHandler import last_roam_buffer_file
 from response.filePreviewHandler import FilePreviewHandler
 from response.roamBufferHandler import RoamBufferHandler
 from response.defaultFiltersHandler import DefaultFiltersHandler
 from response.serverCSSHandler import ServerCSSHandler
+from response.subgraphHandler import SubgraphHandler
+from response.graphStatsHandler import GraphStatsHandler
+from response.clustersHandler import ClustersHandler
+from response.searchHandler import SearchHandler
+from response.metricsHandler import MetricsHandler
+from response.profilesHandler import ProfilesHandler
+from response.pushHandler import PushHandler
+from response.redirectHandler import RedirectHandler
+
+from watcher import Watcher
+from settings import Settings
+from vault import Vault, VaultRegistry, DEFAULT_VAULT
+from assets import AssetRegistry
+from admission import ConcurrencyLimit
+from export import export_site
+from compression import (negotiate, is_compressible, make_etag,
+                         encoded_etag, etag_matches, EncodedBodies,
+                         StreamCompressor, MIN_COMPRESS_SIZE)
 
-from variables import org_roam_directory
 from variables import org_roam_db
+from variables import org_roam_server_light_tmp_dir
+
+# Requests an endpoint computes responses for at once, more wait
+# up to QUEUE_TIMEOUT seconds for a free slot and get 503 after that.
+# Streams give their slot back once their first event is computed.
+QUEUE_TIMEOUT = 10
+ENDPOINT_LIMITS = {
+    "/roam-data": 8,
+    "/org-roam-buffer": 8,
+    "/subgraph": 4,
+    "/search": 8,
+    "/graph-stats": 4,
+    "/clusters": 4,
+    ".html": 16,
+}
+
+file_watcher = Watcher()
+settings = Settings(org_roam_server_light_tmp_dir, file_watcher)
+vaults = VaultRegistry(org_roam_server_light_tmp_dir)
+# Vault of Emacs which started the server, served without prefix
+default_vault = Vault(
+    DEFAULT_VAULT, settings.get("org-roam-directory"), org_roam_db,
+    org_roam_server_light_tmp_dir, file_watcher)
+vaults.add_vault(default_vault)
+static_assets = AssetRegistry("public")
+templates = AssetRegistry("templates")
+encoded_bodies = EncodedBodies()
+profiler = None
+
+
+def apply_settings():
+    # Moving the DB or directory in Emacs doesn't need a restart
+    default_vault.directory = settings.get("org-roam-directory")
+    path = settings.get("org-roam-db-location")
+    if path:
+        default_vault.database.relocate(path)
+
+
+settings.subscribe("org-roam-directory", apply_settings)
+settings.subscribe("org-roam-db-location", apply_settings)
+
+
+def prerender_current_buffer():
+    graph = default_vault.graph_store.get()
+    current_buffer = (file_watcher.read(last_roam_buffer_file) or "").strip()
+    neighbours = graph.neighbours.get(current_buffer, ())
+    default_vault.preview_cache.prerender(
+        [graph.nodes[node_id].path for node_id in neighbours])
+
+
+def enable_prerender():
+    # Render previews of notes linked with the current buffer in advance
+    file_watcher.subscribe(last_roam_buffer_file, prerender_current_buffer)
+
+
+def enable_layout():
+    vaults.enable_layout()
+
+
+def add_vault(name, directory, db_path):
+    # Served under /vault/NAME/ or with vault=NAME
+    vaults.add(name, directory, db_path)
+
+
+def enable_profiling(threshold, mode):
+    # Keep cProfile or tracemalloc reports of requests slower than
+    # threshold seconds, served on /profiles
+    global profiler
+    profiler = metrics.SlowRequestProfiler(threshold, mode)
+
+
+def export_static(directory):
+    # Every vault as plain files, see export.py
+    endpoints = {
+        "network-vis-options.json":
+            NetworkVisHandler(file_watcher).getContents(),
+        "default-filters.json":
+            DefaultFiltersHandler(file_watcher).getContents(),
+        "server-css.css": ServerCSSHandler(file_watcher).getContents(),
+    }
+    with open(os.path.join("templates", "index.html"), "rb") as f:
+        template = f.read()
+    others = [vaults.get(name) for name in vaults.names()
+              if name != DEFAULT_VAULT]
+    return export_site(directory, default_vault, others, endpoints,
+                       template, "public")
+
+
+def network_vis_options(request):
+    return NetworkVisHandler(file_watcher)
+
+
+def default_filters(request):
+    return DefaultFiltersHandler(file_watcher)
+
+
+def server_css(request):
+    return ServerCSSHandler(file_watcher)
+
+
+def roam_data(request):
+    # EventSource resends id of the last received event on reconnect
+    last_event_id = (request.headers.get("Last-Event-ID")
+                     or request.query.get("version"))
+    return RoamDataHandler(
+        request.query.get_bool("force"), request.vault.graph_store,
+        request.vault.roam_events, request.vault.roam_documents,
+        last_event_id,
+        request.query.get("format", "json"))
+
+
+def current_buffer_data(request):
+    return CurrentBufferHandler(
+        file_watcher, request.headers.get("Last-Event-ID"))
+
+
+def org_roam_buffer(request):
+    return RoamBufferHandler(
+        request.vault.backlinks_cache, request.query.require("path"),
+        request.query.get("label", ""))
+
+
+def subgraph(request):
+    return SubgraphHandler(request.vault.graph_store, request.vault.directory,
+                           request.query)
+
+
+def search(request):
+    return SearchHandler(request.vault.search_index, request.query)
+
+
+def graph_stats_data(request):
+    return GraphStatsHandler(request.vault.graph_stats)
+
+
+def clusters(request):
+    return ClustersHandler(request.vault.graph_clusters, request.query)
+
+
+def metrics_data(request):
+    return MetricsHandler()
+
 
+def profiles(request):
+    return ProfilesHandler(profiler)
 
-def get_query_field(url, field):
-    try:
-        return parse_qs(urlparse(url).query)[field]
-    except KeyError:
-        return []
-
-
-def get_fullpath(to_be_exported_file):
-    conn = sqlite3.connect(org_roam_db)
-    c = conn.cursor()
-    path_quoted = '"%' + os.path.basename(to_be_exported_file) + '%"'
-    query = (
-        """
-        SELECT file
-        FROM files
-        WHERE file LIKE '%s'
-        """
-        % path_quoted
-    )
-    c.execute(query)
-    results = c.fetchall()
-    conn.close()
-    f = results[0][0].strip('"')
-    return f
+
+def push(request):
+    return PushHandler(settings, request.headers.get("Authorization"),
+                       request.body)
+
+
+def template(route):
+    def factory(request):
+        handler = TemplateHandler(templates)
+        handler.find(route)
+        return handler
+    return factory
+
+
+def file_preview(request):
+    # Unknown notes are answered by the handler, routing doesn't
+    # touch the DB or the file system
+    name = os.path.splitext(os.path.basename(request.path))[0]
+    vault = request.vault
+    return FilePreviewHandler(
+        name, vault.graph_store, vault.directory, vault.preview_cache)
+
+
+def static(request):
+    handler = StaticHandler(static_assets)
+    handler.find(request.path)
+    return handler
+
+
+def endpoint_limit(name):
+    return ConcurrencyLimit(ENDPOINT_LIMITS[name], QUEUE_TIMEOUT)
+
+
+router = Router()
+router.add("/network-vis-options", network_vis_options)
+router.add("/default-filters", default_filters)
+router.add("/server-css", server_css)
+router.add("/roam-data", roam_data, limit=endpoint_limit("/roam-data"))
+router.add("/current-buffer-data", current_buffer_data)
+router.add("/org-roam-buffer", org_roam_buffer,
+           limit=endpoint_limit("/org-roam-buffer"))
+router.add("/subgraph", subgraph, limit=endpoint_limit("/subgraph"))
+router.add("/search", search, limit=endpoint_limit("/search"))
+router.add("/graph-stats", graph_stats_data,
+           limit=endpoint_limit("/graph-stats"))
+router.add("/clusters", clusters, limit=endpoint_limit("/clusters"))
+router.add("/metrics", metrics_data)
+router.add("/profiles", profiles)
+router.add("/push", push, methods=("POST",))
+for path, route in routes.items():
+    router.add(path, template(route))
+router.add_extension(".html", file_preview, limit=endpoint_limit(".html"))
+router.add_extension(".py", lambda request: BadRequestHandler())
+router.set_default(static)
 
 
 class Server(BaseHTTPRequestHandler):
     def do_HEAD(self):
-        return
+        self.dispatch()
 
     def do_GET(self):
-        global org_roam_db
-
-        requested_file = os.path.basename(urlparse(self.path)[2])
-        requested_extension = os.path.splitext(requested_file)[1]
-        requested_filename = os.path.splitext(requested_file)[0]
-        to_be_exported_file = os.path.join(
-            org_roam_directory, requested_filename + ".org")
-
-        if "network-vis-options" in self.path:
-            handler = NetworkVisHandler()
-
-        elif "default-filters" in self.path:
-            handler = DefaultFiltersHandler()
-
-        elif "server-css" in self.path:
-            handler = ServerCSSHandler()
-
-        elif "roam-data" in self.path:
-            self.roam_force = get_query_field(self.path, "force")
-            handler = RoamDataHandler(self.roam_force, org_roam_db)
-
-        elif "current-buffer-data" in self.path:
-            handler = CurrentBufferHandler()
-
-        elif "org-roam-buffer" in self.path:
-            file_path = get_query_field(self.path, "path")
-            file_label = get_query_field(self.path, "label")
-            handler = RoamBufferHandler(org_roam_db, file_path, file_label)
-
-        elif (requested_file
-              and requested_extension == ".html"
-              and os.path.isfile(to_be_exported_file)):
-            handler = FilePreviewHandler(to_be_exported_file, org_roam_db)
-
-        elif (requested_file
-              and requested_extension == ".html"
-              and os.path.isfile(get_fullpath(to_be_exported_file))):
-            handler = FilePreviewHandler(
-                get_fullpath(to_be_exported_file), org_roam_db)
-
-        elif requested_extension == "" or requested_extension == ".html":
-            if self.path in routes:
-                handler = TemplateHandler()
-                handler.find(routes[self.path])
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        self.started = time.perf_counter()
+        self.recorded = False
+        # ConcurrencyLimit the request holds a slot of
+        self.slot = None
+        stream = self.command == "GET" and self.can_stream()
+        try:
+            if profiler is not None and not stream:
+                with profiler.sample(self.command + " " + self.path):
+                    self.respond({"handler": self.find_handler(),
+                                  "stream": stream})
             else:
-                handler = BadRequestHandler()
+                self.respond({"handler": self.find_handler(),
+                              "stream": stream})
+        finally:
+            self.release_slot()
 
-        elif requested_extension == ".py":
-            handler = BadRequestHandler()
-        else:
-            handler = StaticHandler()
-            handler.find(self.path)
+    def find_handler(self):
+        request = Request(self.command, self.path, self.headers)
+        request.vault = vaults.get(request.vault_name or DEFAULT_VAULT)
+        if request.vault is None:
+            return BadRequestHandler()
+        if not request.path:
+            # Pages of a vault load everything relative to its prefix
+            path, separator, query = self.path.partition("?")
+            return RedirectHandler(path + "/" + separator + query)
+        route = router.find(request.path)
+        if route is None:
+            return BadRequestHandler()
+        if self.command not in route.methods:
+            return BadRequestHandler(405, {"Allow": ", ".join(route.methods)})
+
+        if self.command == "POST":
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                return BadRequestHandler(400)
+            if length > MAX_BODY_SIZE:
+                self.close_connection = True
+                return BadRequestHandler(413)
+            request.body = self.rfile.read(length)
+
+        if route.limit is not None:
+            if not route.limit.acquire():
+                metrics.rejected_requests.inc(route.key)
+                return BadRequestHandler(
+                    503, {"Retry-After": str(QUEUE_TIMEOUT)})
+            self.slot = route.limit
 
-        self.respond({"handler": handler})
+        try:
+            return route.factory(request)
+        except QueryError as e:
+            print(e)
+            return BadRequestHandler(400)
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.slot.release()
+            self.slot = None
+
+    def can_stream(self):
+        # Only EventSource clients of threaded server get long-lived responses
+        return (getattr(self.server, "streaming", False)
+                and "text/event-stream" in self.headers.get("Accept", ""))
 
     def handle_http(self, handler):
         status_code = handler.getStatus()
 
-        self.send_response(status_code)
+        if status_code != 200:
+            content = bytes("%d %s" % (
+                status_code, self.responses[status_code][0]), "UTF-8")
+            self.send_response(status_code)
+            self.send_header("Content-type", "text/plain")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_headers(handler)
+            self.end_headers()
+            return content
 
-        if status_code == 200:
+        file = handler.getFile()
+        if file is None:
             content = handler.getContents()
-            self.send_header("Content-type", handler.getContentType())
+            if not isinstance(content, bytes):
+                content = bytes(content, "UTF-8")
+            size = len(content)
         else:
-            content = "404 Not Found"
+            content = None
+            size = file[1]
+        content_type = handler.getContentType()
+
+        encoding = None
+        if is_compressible(content_type, size):
+            encoding = negotiate(self.headers.get("Accept-Encoding"))
+            if content is None and handler.getEncoded(encoding) is None:
+                encoding = None
+        identity_etag = handler.getETag() or make_etag(content)
+        etag = encoded_etag(identity_etag, encoding)
+
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_validators(handler, etag)
+            self.end_headers()
+            return b""
 
+        if encoding is not None:
+            content = (handler.getEncoded(encoding)
+                       or encoded_bodies.get(etag, encoding, content))
+            size = len(content)
+
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(size))
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_validators(handler, etag)
         self.end_headers()
 
-        if isinstance(content, bytes):
-            return content
-        else:
-            return bytes(content, "UTF-8")
+        # Files too big to keep in memory are sent by the kernel
+        return content if content is not None else file
+
+    def send_validators(self, handler, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", handler.getCacheControl())
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_headers(handler)
+
+    def send_headers(self, handler):
+        for name, value in handler.getHeaders().items():
+            self.send_header(name, value)
+
+    def handle_stream(self, handler, stream):
+        # First event was computed with the handler,
+        # waiting for changes doesn't count against the limit
+        self.release_slot()
+        self.send_response(handler.getStatus())
+        self.send_header("Content-type", handler.getContentType())
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            for chunk in stream:
+                self.write(bytes(chunk, "UTF-8"))
+                self.wfile.flush()
+                self.record()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def handle_chunks(self, handler, chunks):
+        # Length isn't known in advance, end of body is marked by closing
+        # the connection
+        content_type = handler.getContentType()
+        encoding = None
+        if is_compressible(content_type, MIN_COMPRESS_SIZE):
+            encoding = negotiate(self.headers.get("Accept-Encoding"))
+        etag = encoded_etag(handler.getETag(), encoding)
+
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_validators(handler, etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_validators(handler, etag)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if self.command == "HEAD":
+            return
+
+        compressor = StreamCompressor(encoding) if encoding else None
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = bytes(chunk, "UTF-8")
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    self.write(chunk)
+            if compressor is not None:
+                self.write(compressor.flush())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_file(self, fd, size):
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(
+                self.connection.fileno(), fd, offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+        metrics.response_bytes.inc(self.handler_name, amount=offset)
+
+    def write(self, data):
+        self.wfile.write(data)
+        metrics.response_bytes.inc(self.handler_name, amount=len(data))
+
+    def send_response(self, code, message=None):
+        self.status_sent = code
+        super().send_response(code, message)
+
+    def record(self):
+        # Once per request, streams are recorded after their first event
+        if self.recorded:
+            return
+        self.recorded = True
+        metrics.requests.inc(self.handler_name, str(self.status_sent))
+        metrics.request_duration.observe(
+            time.perf_counter() - self.started, self.handler_name)
 
     def respond(self, opts):
-        response = self.handle_http(opts["handler"])
-        self.wfile.write(response)
+        handler = opts["handler"]
+        self.handler_name = type(handler).__name__
+        stream = handler.getStream() if opts.get("stream") else None
+        chunks = handler.getChunks() if handler.getStatus() == 200 else None
+        if stream is not None:
+            self.handle_stream(handler, stream)
+        elif chunks is not None:
+            self.handle_chunks(handler, chunks)
+        else:
+            response = self.handle_http(handler)
+            # HEAD gets the same headers as GET, without the body
+            if self.command != "HEAD":
+                if isinstance(response, bytes):
+                    self.write(response)
+                else:
+                    self.send_file(*response)
+        self.record()
+
+
+class QuietServer(Server):
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import os
+import hmac
+import secrets
+
+# Settings Emacs pushes to /push, named after its variables. Each one
+# is also read from the file of the same name in tmp dir, which is how
+# they are handed over at startup.
+NAMES = (
+    "org-roam-server-light-last-roam-buffer",
+    "org-roam-server-light-network-vis-options",
+    "org-roam-server-light-default-include-filters",
+    "org-roam-server-light-default-exclude-filters",
+    "org-roam-server-light-style",
+    "org-roam-db-location",
+    "org-roam-directory",
+)
+TOKEN_ENV = "ORG_ROAM_SERVER_LIGHT_TOKEN"
+TOKEN_FILE = "org-roam-server-light-token"
+
+
+def load_token(directory):
+    # Emacs passes a token to the server it starts, servers started
+    # by hand make their own, readable only by the same user
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    token = secrets.token_urlsafe(32)
+    path = os.path.join(str(directory), TOKEN_FILE)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+class Settings:
+    def __init__(self, directory, watcher):
+        self.directory = directory
+        self.watcher = watcher
+        self.token = load_token(directory)
+
+    def path(self, name):
+        return self.directory / name
+
+    def get(self, name):
+        return self.watcher.read(self.path(name))
+
+    def subscribe(self, name, callback):
+        self.watcher.subscribe(self.path(name), callback)
+
+    def authorized(self, header):
+        # Authorization: Bearer <token>
+        scheme, _, token = (header or "").partition(" ")
+        return (scheme.lower() == "bearer"
+                and hmac.compare_digest(token.strip().encode("utf8"),
+                                        self.token.encode("utf8")))
+
+    def update(self, values):
+        # Applied in memory, readers and event streams see new values
+        # right away and files in tmp dir aren't touched
+        for name, value in values.items():
+            self.watcher.push(self.path(name), value)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import json
+
+# Bumping it makes snapshots written by older versions invalid,
+# needed whenever the stored data changes shape
+SNAPSHOT_VERSION = 1
+
+
+def db_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def save(path, db_path, stamp, data):
+    # Only the user running the server may read or replace the file,
+    # it's written next to its final place and renamed, so readers
+    # never see a partial file
+    snapshot = dict(data, version=SNAPSHOT_VERSION, db=str(db_path),
+                    stamp=stamp)
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary, path)
+
+
+def load(path, db_path):
+    # (stamp, data) stored for DB at db_path, None when there is no
+    # usable snapshot. Plain JSON, so a planted file can't run code,
+    # and files of other users are ignored anyway.
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            stat = os.fstat(f.fileno())
+            if hasattr(os, "getuid") and stat.st_uid != os.getuid():
+                print("Ignoring graph snapshot %s of another user" % path)
+                return None
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print("Ignoring graph snapshot %s: %s" % (path, e))
+        return None
+    if (not isinstance(snapshot, dict)
+            or snapshot.get("version") != SNAPSHOT_VERSION
+            or snapshot.get("db") != str(db_path)):
+        return None
+    return snapshot["stamp"], snapshot
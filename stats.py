@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import json
+from graph import path_to_id
+from worker import GraphJob
+from compression import make_etag
+
+DAMPING = 0.85
+MAX_PAGERANK_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6
+HUB_COUNT = 20
+
+
+def pagerank(out_links, count):
+    if count == 0:
+        return []
+    ranks = [1.0 / count] * count
+    for _ in range(MAX_PAGERANK_ITERATIONS):
+        # Rank of notes without outgoing links is spread over all notes
+        dangling = sum(ranks[i] for i in range(count) if not out_links[i])
+        base = (1 - DAMPING + DAMPING * dangling) / count
+        new_ranks = [base] * count
+        for source in range(count):
+            targets = out_links[source]
+            if targets:
+                share = DAMPING * ranks[source] / len(targets)
+                for target in targets:
+                    new_ranks[target] += share
+        error = sum(abs(new - old) for new, old in zip(new_ranks, ranks))
+        ranks = new_ranks
+        if error < PAGERANK_TOLERANCE:
+            break
+    return ranks
+
+
+def components(neighbours, count):
+    # Component of every node, components numbered from the largest
+    labels = [-1] * count
+    sizes = []
+    for start in range(count):
+        if labels[start] != -1:
+            continue
+        label = len(sizes)
+        labels[start] = label
+        frontier = [start]
+        size = 0
+        while frontier:
+            node = frontier.pop()
+            size += 1
+            for neighbour in neighbours[node]:
+                if labels[neighbour] == -1:
+                    labels[neighbour] = label
+                    frontier.append(neighbour)
+        sizes.append(size)
+    order = sorted(range(len(sizes)), key=lambda label: -sizes[label])
+    renumber = {label: i for i, label in enumerate(order)}
+    return [renumber[label] for label in labels], [sizes[i] for i in order]
+
+
+def compute_stats(ids, edges, dead_links):
+    # Runs in a worker process, ids are node ids and edges
+    # (source index, dest index) pairs
+    count = len(ids)
+    out_links = [[] for _ in range(count)]
+    neighbours = [set() for _ in range(count)]
+    in_degree = [0] * count
+    for source, dest in edges:
+        out_links[source].append(dest)
+        in_degree[dest] += 1
+        neighbours[source].add(dest)
+        neighbours[dest].add(source)
+
+    ranks = pagerank(out_links, count)
+    labels, sizes = components(neighbours, count)
+    hubs = sorted(range(count), key=lambda i: (-ranks[i], ids[i]))[:HUB_COUNT]
+
+    return {
+        "nodes": {
+            ids[i]: {
+                "degree": len(neighbours[i]),
+                "in": in_degree[i],
+                "out": len(out_links[i]),
+                "pagerank": round(ranks[i], 8),
+                "component": labels[i],
+            } for i in range(count)},
+        "components": sizes,
+        "orphans": [ids[i] for i in range(count) if not neighbours[i]],
+        "deadLinks": dead_links,
+        "hubs": [ids[i] for i in hubs],
+    }
+
+
+class GraphStats(GraphJob):
+    def __init__(self, graph_store):
+        # Graph the current results were computed for
+        self.graph = None
+        self.body = None
+        self.etag = None
+        super().__init__(graph_store)
+
+    def changed(self, old, new):
+        return (super().changed(old, new)
+                or old.backlinks.keys() != new.backlinks.keys())
+
+    def prepare(self, graph):
+        ids, edges = self.indexed_edges(graph)
+        # Links pointing to files which aren't notes in the DB
+        dead_links = [{"source": path_to_id(backlink.source), "target": dest}
+                      for dest, backlinks in graph.backlinks.items()
+                      if dest not in graph.by_path
+                      for backlink in backlinks]
+        return compute_stats, (ids, edges, dead_links)
+
+    def finish(self, graph, stats):
+        stats["version"] = self.graph_store.format_version(graph.version)
+        body = json.dumps(stats, ensure_ascii=False)
+        with self.finished:
+            self.graph = graph
+            self.body = body
+            self.etag = make_etag(body.encode("utf8"))
+            self.finished.notify_all()
+
+    def get(self, timeout):
+        # (body, etag) of results matching the current graph,
+        # None when they aren't ready within timeout
+        graph = self.graph_store.get()
+        with self.finished:
+            if self.finished.wait_for(
+                    lambda: (self.graph is not None
+                             and not self.changed(self.graph, graph)),
+                    timeout):
+                return self.body, self.etag
+        return None
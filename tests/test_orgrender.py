@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import unittest
+import orgrender
+
+
+def render(text):
+    return "".join(orgrender.render(text.splitlines(True)))
+
+
+class HeadingTest(unittest.TestCase):
+    def test_levels(self):
+        self.assertEqual(render("* One\n** Two\n******** Eight\n"),
+                         "<h1>One</h1>\n<h2>Two</h2>\n<h6>Eight</h6>\n")
+
+    def test_todo_keyword(self):
+        self.assertEqual(
+            render("* TODO Buy milk\n* DONE\n"),
+            '<h1><span class="todo TODO">TODO</span> Buy milk</h1>\n'
+            '<h1><span class="todo DONE">DONE</span> </h1>\n')
+
+    def test_escaped(self):
+        self.assertEqual(render("* <b> & </b>\n"),
+                         "<h1>&lt;b&gt; &amp; &lt;/b&gt;</h1>\n")
+
+    def test_tags_unsupported(self):
+        with self.assertRaises(orgrender.Unsupported):
+            render("* Heading :tag:\n")
+
+
+class ListTest(unittest.TestCase):
+    def test_nested(self):
+        self.assertEqual(
+            render("- one\n- two\n  - nested\n- three\n"),
+            "<ul>\n<li>one</li>\n<li>two\n<ul>\n<li>nested</li>\n</ul></li>\n"
+            "<li>three</li>\n</ul>\n")
+
+    def test_ordered(self):
+        self.assertEqual(render("1. first\n2) second\n"),
+                         "<ol>\n<li>first</li>\n<li>second</li>\n</ol>\n")
+
+    def test_description(self):
+        self.assertEqual(render("- term :: what <it> is\n"),
+                         "<dl>\n<dt>term</dt>\n<dd>what &lt;it&gt; is</dd>\n"
+                         "</dl>\n")
+
+    def test_continued_item(self):
+        self.assertEqual(render("- first line\n  second line\nafter\n"),
+                         "<ul>\n<li>first line\nsecond line</li>\n</ul>\n"
+                         "<p>after</p>\n")
+
+    def test_unsupported(self):
+        for text in ["- [ ] task\n", "- one\n\n- two\n"]:
+            with self.assertRaises(orgrender.Unsupported):
+                render(text)
+
+
+class LinkTest(unittest.TestCase):
+    def test_file_link_to_note(self):
+        self.assertEqual(render("[[file:daily/2019.org][The /day/]]\n"),
+                         '<p><a href="daily/2019.html">The <em>day</em></a>'
+                         "</p>\n")
+
+    def test_file_link_without_description(self):
+        self.assertEqual(render("[[file:note.org]]\n"),
+                         '<p><a href="note.html">note.org</a></p>\n')
+
+    def test_href_escaped(self):
+        self.assertEqual(render('[[https://x.org/?a=1&b="2"][x]]\n'),
+                         '<p><a href="https://x.org/?a=1&amp;b=&quot;2&quot;">'
+                         "x</a></p>\n")
+
+    def test_plain_url(self):
+        self.assertEqual(render("See https://example.com/p.\n"),
+                         '<p>See <a href="https://example.com/p" class="uri">'
+                         "https://example.com/p</a>.</p>\n")
+
+    def test_unsupported(self):
+        # id links, search options and inline images are left to pandoc
+        for text in ["[[id:0b5c5a8e][Heading]]\n",
+                     "[[file:note.org::*Heading]]\n",
+                     "[[file:image.png]]\n"]:
+            with self.assertRaises(orgrender.Unsupported):
+                render(text)
+
+
+class BlockTest(unittest.TestCase):
+    def test_src(self):
+        self.assertEqual(
+            render("#+begin_src python\n  if a < b:\n      ,* x\n#+end_src\n"),
+            '<pre class="sourceCode python"><code>if a &lt; b:\n    * x'
+            "</code></pre>\n")
+
+    def test_example(self):
+        self.assertEqual(render("#+BEGIN_EXAMPLE\n<b>\n#+END_EXAMPLE\n"),
+                         '<pre class="example"><code>&lt;b&gt;</code></pre>\n')
+
+    def test_quote(self):
+        self.assertEqual(
+            render("#+begin_quote\nSome /words/ & more\n- item\n"
+                   "#+end_quote\nafter\n"),
+            "<blockquote>\n<p>Some <em>words</em> &amp; more</p>\n"
+            "<ul>\n<li>item</li>\n</ul>\n</blockquote>\n<p>after</p>\n")
+
+    def test_unsupported(self):
+        for text in ["#+begin_center\nx\n#+end_center\n",
+                     "#+begin_src python\nx = 1\n"]:
+            with self.assertRaises(orgrender.Unsupported):
+                render(text)
+
+
+class DrawerTest(unittest.TestCase):
+    def test_properties_dropped(self):
+        self.assertEqual(
+            render(":PROPERTIES:\n:ID: abc\n:END:\n#+title: Note\nText\n"),
+            "<p>Text</p>\n")
+
+    def test_unsupported(self):
+        for text in [":LOGBOOK:\n- note\n:END:\n",
+                     ":PROPERTIES:\n:ID: abc\n"]:
+            with self.assertRaises(orgrender.Unsupported):
+                render(text)
+
+
+class TextTest(unittest.TestCase):
+    def test_escaped(self):
+        self.assertEqual(render("1 < 2 && <script>\n"),
+                         "<p>1 &lt; 2 &amp;&amp; &lt;script&gt;</p>\n")
+
+    def test_code_escaped(self):
+        self.assertEqual(render("Use =<br>= or ~a & b~\n"),
+                         "<p>Use <code>&lt;br&gt;</code> or "
+                         "<code>a &amp; b</code></p>\n")
+
+    def test_smart_punctuation(self):
+        self.assertEqual(render("\"q\" -- it's...\n"),
+                         "<p>\u201cq\u201d \u2013 it\u2019s\u2026</p>\n")
+
+    def test_unsupported(self):
+        for text in ["| a | b |\n", "Note[fn:1]\n", "H_2O\n",
+                     "#+options: toc:nil\n"]:
+            with self.assertRaises(orgrender.Unsupported):
+                render(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
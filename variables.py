@@ -11,7 +11,13 @@ elif platform == "darwin":
 else:
     tmp_dir = '/tmp'
 
-org_roam_server_light_tmp_dir = Path(tmp_dir) / "org-roam-server-light"
+# Overridden e.g. by the benchmark suite, so it doesn't touch files
+# written by Emacs
+if "ORG_ROAM_SERVER_LIGHT_TMP_DIR" in environ:
+    org_roam_server_light_tmp_dir = Path(
+        environ["ORG_ROAM_SERVER_LIGHT_TMP_DIR"])
+else:
+    org_roam_server_light_tmp_dir = Path(tmp_dir) / "org-roam-server-light"
 
 org_roam_directory = (org_roam_server_light_tmp_dir /
                       "org-roam-directory").read_text()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import re
+import threading
+from watcher import Watcher
+from database import Database
+from graph import GraphStore
+from backlinks import BacklinksCache
+from stats import GraphStats
+from clusters import GraphClusters
+from search import SearchIndex
+from preview import PreviewCache
+from layout import LayoutStore
+from admission import SharedResults
+
+DEFAULT_VAULT = "default"
+VAULT_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+# /roam-data events kept for streams which are behind
+SHARED_EVENTS = 8
+# Encoded /roam-data documents, of the latest versions in every format
+SHARED_DOCUMENTS = 4
+
+
+class Vault:
+    # Caches, connections and background jobs serving one org-roam DB.
+    # Vaults don't share anything, each has its own watcher unless given one.
+    def __init__(self, name, directory, db_path, cache_dir, watcher=None,
+                 layout=False):
+        self.name = name
+        self.directory = directory
+        self.watcher = watcher or Watcher()
+        self.database = Database(db_path, self.watcher)
+        self.graph_store = GraphStore(
+            self.database, cache_dir / "graph-snapshot.json")
+        self.backlinks_cache = BacklinksCache(self.graph_store)
+        self.roam_events = SharedResults("event", SHARED_EVENTS)
+        self.roam_documents = SharedResults("document", SHARED_DOCUMENTS)
+        self.graph_stats = GraphStats(self.graph_store)
+        self.graph_clusters = GraphClusters(self.graph_store)
+        self.search_index = SearchIndex(
+            cache_dir / "search-index.db", self.graph_store)
+        self.preview_cache = PreviewCache(
+            cache_dir / "preview-cache", self.graph_store)
+        self.layout_store = None
+        if layout:
+            self.enable_layout()
+
+    def enable_layout(self):
+        # Node coordinates are computed in a worker process after every change
+        if self.layout_store is None:
+            self.layout_store = LayoutStore(self.graph_store)
+
+
+class VaultRegistry:
+    def __init__(self, cache_dir):
+        # Caches of other vaults than the default one live in
+        # cache_dir/vaults/NAME
+        self.cache_dir = cache_dir
+        self.layout = False
+        # name -> (directory, DB path) of vaults not opened yet
+        self.configs = {}
+        # name -> Vault
+        self.vaults = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, directory, db_path):
+        if not VAULT_NAME.match(name):
+            raise ValueError("Invalid vault name: %r" % name)
+        with self.lock:
+            self.configs[name] = (directory, db_path)
+
+    def add_vault(self, vault):
+        with self.lock:
+            self.vaults[vault.name] = vault
+
+    def enable_layout(self):
+        with self.lock:
+            self.layout = True
+            vaults = list(self.vaults.values())
+        for vault in vaults:
+            vault.enable_layout()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.configs.keys() | self.vaults.keys())
+
+    def get(self, name):
+        # Vaults are opened on first request, so idle ones cost nothing.
+        # None for unknown names.
+        with self.lock:
+            vault = self.vaults.get(name)
+            if vault is not None or name not in self.configs:
+                return vault
+            directory, db_path = self.configs[name]
+            cache_dir = self.cache_dir / "vaults" / name
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            vault = self.vaults[name] = Vault(
+                name, directory, db_path, cache_dir, layout=self.layout)
+            return vault
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+
+# Polling fallback checks watched files this often
+POLL_INTERVAL = 1
+# Burst of events (e.g. sqlite writing a transaction) is handled
+# once nothing happened for this long
+DEBOUNCE_INTERVAL = 0.1
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+           | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # Raises AttributeError on platforms without inotify
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> directory
+        self.dirs = {}
+
+    def add_dir(self, directory):
+        if directory in self.dirs.values():
+            return
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), IN_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.dirs[wd] = directory
+
+    def read(self, timeout):
+        # Paths of changed files, empty list when timeout passed
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if wd in self.dirs and name:
+                paths.append(os.path.join(self.dirs[wd], os.fsdecode(name)))
+        return paths
+
+
+class WatchedFile:
+    __slots__ = ("stamp", "disk", "cached", "contents", "callbacks")
+
+    def __init__(self, stamp):
+        self.stamp = stamp
+        # Stamp of the file on disk, differs from stamp after a push
+        self.disk = stamp
+        self.cached = False
+        self.contents = None
+        self.callbacks = []
+
+
+class Watcher:
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        try:
+            self.inotify = Inotify()
+        except (AttributeError, OSError):
+            self.inotify = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def watch(self, path):
+        # Must be called with lock held
+        path = os.path.abspath(str(path))
+        if path not in self.files:
+            if self.inotify is not None:
+                try:
+                    self.inotify.add_dir(os.path.dirname(path))
+                except OSError:
+                    self.inotify = None
+            self.files[path] = WatchedFile(file_stamp(path))
+        return self.files[path]
+
+    def subscribe(self, path, callback):
+        with self.lock:
+            self.watch(path).callbacks.append(callback)
+
+    def unsubscribe(self, path, callback):
+        with self.lock:
+            callbacks = self.watch(path).callbacks
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def push(self, path, contents):
+        # Replace contents of a file in memory only, e.g. with values
+        # sent by Emacs. The file takes over again once it changes on disk.
+        with self.lock:
+            watched = self.watch(path)
+            if watched.cached and watched.contents == contents:
+                return
+            watched.stamp = (time.time(), len(contents), None)
+            watched.contents = contents
+            watched.cached = True
+            callbacks = list(watched.callbacks)
+            self.changed.notify_all()
+        for callback in callbacks:
+            callback()
+
+    def state(self, path):
+        # (stamp, contents) of a file, both None when it doesn't exist.
+        # Only the first call for each file touches the disk.
+        with self.lock:
+            watched = self.watch(path)
+            if not watched.cached:
+                watched.contents = self.load(path, watched.stamp)
+                watched.cached = True
+            return watched.stamp, watched.contents
+
+    def read(self, path):
+        return self.state(path)[1]
+
+    def stamp(self, path):
+        with self.lock:
+            return self.watch(path).stamp
+
+    def wait(self, path, stamp, timeout):
+        # Block until file changes from stamp or timeout passes
+        with self.changed:
+            watched = self.watch(path)
+            self.changed.wait_for(lambda: watched.stamp != stamp, timeout)
+            return watched.stamp
+
+    def wait_any(self, stamps, timeout):
+        # Like wait, for a dict of path -> stamp
+        with self.changed:
+            watched = [(self.watch(path), stamp)
+                       for path, stamp in stamps.items()]
+            self.changed.wait_for(
+                lambda: any(w.stamp != stamp for w, stamp in watched),
+                timeout)
+
+    def load(self, path, stamp):
+        if stamp is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def refresh(self, paths):
+        callbacks = []
+        with self.lock:
+            for path in paths:
+                watched = self.files.get(path)
+                if watched is None:
+                    continue
+                stamp = file_stamp(path)
+                if stamp == watched.disk:
+                    continue
+                watched.stamp = watched.disk = stamp
+                if watched.cached:
+                    watched.contents = self.load(path, stamp)
+                callbacks.extend(watched.callbacks)
+            self.changed.notify_all()
+        for callback in callbacks:
+            callback()
+
+    def run(self):
+        pending = set()
+        while True:
+            if self.inotify is None:
+                self.poll()
+                continue
+            try:
+                paths = self.inotify.read(
+                    DEBOUNCE_INTERVAL if pending else POLL_INTERVAL)
+            except OSError:
+                self.inotify = None
+                continue
+            if paths:
+                pending.update(path for path in paths if path in self.files)
+            elif pending:
+                self.refresh(pending)
+                pending = set()
+
+    def poll(self):
+        time.sleep(POLL_INTERVAL)
+        with self.lock:
+            paths = list(self.files)
+        self.refresh(paths)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from graph import Graph
+
+# Processes shared by layout and analytics jobs
+MAX_WORKERS = 2
+
+pool = None
+pool_lock = threading.Lock()
+# Cleared in processes which exit before results of jobs are used
+enabled = True
+
+
+def pool_context():
+    # Workers must not be forked from the serving process, they would
+    # inherit its listening socket and locks held by other threads
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def worker_pool():
+    # Started on first use, so processes which never need it don't pay for it
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                       mp_context=pool_context())
+        return pool
+
+
+class GraphJob:
+    # Recomputes results for the newest graph in a worker process,
+    # one run at a time. Graphs built while a run is in progress
+    # are coalesced into a single next run. Subclasses set up their
+    # own state before calling __init__, which may already start a run.
+    def __init__(self, graph_store):
+        self.graph_store = graph_store
+        self.lock = threading.Lock()
+        # Notified by subclasses once results of a run are stored
+        self.finished = threading.Condition(self.lock)
+        self.running = False
+        # Newest graph which still needs a run, None when up to date
+        self.waiting = None
+        with graph_store.lock:
+            graph_store.subscribe(self.schedule)
+            # Graph may have been built before this job was created
+            if graph_store.graph.version > 0:
+                self.schedule(Graph(), graph_store.graph)
+
+    def changed(self, old, new):
+        return (old.nodes.keys() != new.nodes.keys()
+                or old.edges.keys() != new.edges.keys())
+
+    def prepare(self, graph):
+        # (function, arguments) to run in the worker, both picklable
+        raise NotImplementedError
+
+    def indexed_edges(self, graph):
+        # (ids of nodes, links as pairs of their indices in ids),
+        # which is what worker functions get the graph as
+        ids = list(graph.nodes)
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        edges = [(index[source], index[dest])
+                 for source, dest in graph.edges
+                 if source in index and dest in index]
+        return ids, edges
+
+    def finish(self, graph, result):
+        raise NotImplementedError
+
+    def schedule(self, old, new):
+        # Called by graph store, versions which only changed
+        # something this job doesn't use are skipped
+        if not self.changed(old, new):
+            return
+        with self.lock:
+            self.waiting = new
+            if self.running:
+                return
+            self.running = True
+        self.start()
+
+    def start(self):
+        with self.lock:
+            graph, self.waiting = self.waiting, None
+            if graph is None or not enabled:
+                self.running = False
+                return
+        function, arguments = self.prepare(graph)
+        future = worker_pool().submit(function, *arguments)
+        future.add_done_callback(lambda future: self.done(graph, future))
+
+    def done(self, graph, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print("%s failed: %s" % (type(self).__name__, e))
+        else:
+            self.finish(graph, result)
+        self.start()